@@ -0,0 +1,125 @@
+"""
+Стоимость вывода строки списка СИ: функции ячеек, созданные один раз
+(`ListMixin.get_cell_renderers`), против определения вида поля для каждой
+ячейки (`lookup_field`, `display_for_field`, `format_html`).
+
+Строки создаются `RowLoader` из синтетических значений, без БД.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_list_cells --rows 1000
+"""
+import argparse
+import datetime
+import time
+
+from flask import g
+from sqlalchemy import Boolean, Date, Integer
+from sqlalchemy.orm import Relationship
+from werkzeug.routing import BuildError
+
+from src.core.utils import (
+    display_for_field, display_for_value, format_html, lookup_field
+)
+from src.db.registry import get_model_meta
+from src.main import app
+from src.service.views import ListSiView
+
+
+def make_rows(view, count):
+    keys = [field.key for field, _ in view.get_query().ordering_fields]
+    row_loader = get_model_meta(g.model).get_row_loader(
+        g.fields_display, keys
+    )
+    rows = []
+    for index in range(count):
+        values = []
+        for column in row_loader.columns:
+            if isinstance(column.type, Boolean):
+                values.append(index % 2 == 0)
+            elif isinstance(column.type, Date):
+                values.append(datetime.date(2024, 1, 1 + index % 28))
+            elif isinstance(column.type, Integer):
+                values.append(index + 1)
+            else:
+                values.append(f'{column.key} {index}')
+        rows.append(row_loader.make_row(values))
+    return rows
+
+
+def items_for_result_dynamic(view, result):
+    """Вывод ячеек с определением вида поля для каждой ячейки"""
+    first = True
+    empty_value_display = view.empty_value_display
+    for field_name in g.fields_display:
+        row_classes = ["field-%s" % field_name]
+        try:
+            f, attr, value = lookup_field(field_name, result)
+        except (AttributeError, ValueError):
+            result_repr = empty_value_display
+        else:
+            if f is None:
+                boolean = getattr(attr, "boolean", False)
+                result_repr = display_for_value(
+                    value, empty_value_display, boolean
+                )
+            elif isinstance(f.property, Relationship):
+                field_val = getattr(result, field_name)
+                result_repr = (
+                    empty_value_display if field_val is None else field_val
+                )
+            else:
+                result_repr = display_for_field(
+                    value, f, empty_value_display
+                )
+        row_class = ' class="%s"' % " ".join(row_classes)
+        if first and not g.fields_link:
+            first = False
+            try:
+                url = view.get_url_for_result(result)
+            except BuildError:
+                link_or_text = result_repr
+            else:
+                link_or_text = format_html(
+                    '<a href="{}">{}</a>', url, result_repr
+                )
+            yield format_html('<th{}>{}</th>', row_class, link_or_text)
+        else:
+            yield format_html('<td{}>{}</td>', row_class, result_repr)
+
+
+def measure(rows, render_row, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for row in rows:
+            list(render_row(row))
+    return (time.perf_counter() - start) / repeat / len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.test_request_context('/admin/si/'):
+        view = ListSiView(blueprint_name='si')
+        view.g_init()
+        rows = make_rows(view, args.rows)
+        view.get_cell_renderers()
+
+        dynamic = measure(
+            rows, lambda row: items_for_result_dynamic(view, row),
+            args.repeat,
+        )
+        compiled = measure(rows, view.items_for_result, args.repeat)
+        count_fields = len(g.fields_display)
+
+    print(f'полей в строке: {count_fields}, строк: {args.rows}')
+    print(f'{"вывод ячеек":<28}{"мкс/строка":>12}')
+    print(f'{"по виду поля в ячейке":<28}{dynamic * 1e6:>12.1f}')
+    print(f'{"функции ячеек":<28}{compiled * 1e6:>12.1f}')
+    print(f'ускорение: {dynamic / compiled:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Сравнение поиска СИ: LIKE по полям поиска с внешними соединениями
+(`Query.query_search` без индекса) против полнотекстового индекса FTS5.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_si_search --count-si 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, func, insert, select
+
+from src.config import settings
+from src.core.constants import SEARCH_VAR
+from src.core.queries import Query
+from src.datasource.models import DescriptionMethod, GroupSi, NameSi, TypeSi
+from src.db.database import Base, apply_sqlite_pragmas
+from src.db.registry import get_model_meta
+from src.main import app
+from src.service.models import Si
+import src.users.models  # noqa: F401 регистрация таблиц в Base.metadata
+
+WORDS = [
+    'манометр', 'термометр', 'вольтметр', 'амперметр', 'весы', 'гиря',
+    'штангенциркуль', 'микрометр', 'динамометр', 'секундомер', 'барометр',
+    'гигрометр', 'осциллограф', 'частотомер', 'тахометр', 'рулетка',
+]
+SEARCHES = [
+    'манометр', 'мано', 'нометр', 'МП-1', 'N0123', 'термометр ТК', '01', 'zzz',
+]
+
+
+def fill_database(engine, count_si):
+    Base.metadata.create_all(engine)
+    rnd = random.Random(1)
+    with engine.begin() as conn:
+        conn.execute(insert(GroupSi), [
+            {'name': f'Группа {i}'} for i in range(20)
+        ])
+        conn.execute(insert(NameSi), [
+            {'name': f'{word} {i}'} for i, word in enumerate(WORDS * 5)
+        ])
+        conn.execute(insert(TypeSi), [
+            {'name': f'{prefix}-{i}'}
+            for prefix in ('МП', 'ТК', 'ВК', 'АМ') for i in range(250)
+        ])
+        conn.execute(insert(DescriptionMethod), [
+            {'name': f'ОТ-{i}'} for i in range(100)
+        ])
+        conn.execute(insert(Si), [
+            {
+                'group_si_id': rnd.randint(1, 20),
+                'name_si_id': rnd.randint(1, len(WORDS) * 5),
+                'type_si_id': rnd.randint(1, 1000),
+                'description_method_id': rnd.randint(1, 100),
+                'number': f'N{i:06d}',
+                'nomenclature': rnd.choice(WORDS),
+                'etalon': False,
+                'control_vp': False,
+                'is_service': False,
+            }
+            for i in range(count_si)
+        ])
+
+
+def measure(engine, use_index, value, repeat):
+    search_index = get_model_meta(Si).search_index
+    search_index.ready = use_index
+    with app.test_request_context():
+        q = Query(
+            model=Si,
+            params={SEARCH_VAR: value},
+            fields_search=Si.Meta.fields_search,
+            limit=100,
+        )
+    query = select(Si.id).select_from(Si)
+    for j in q.outer_joins:
+        query = query.outerjoin(j)
+    query = query.where(*q.filters)
+    page = query.order_by(Si.id).limit(100)
+    count = select(func.count()).select_from(query.subquery())
+
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            total = conn.execute(count).scalar()
+            conn.execute(page).all()
+        elapsed = (time.perf_counter() - start) / repeat
+
+    return total, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count-si', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = create_engine(f'sqlite:///{path}')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, settings.SQLITE_PRAGMAS)
+
+    try:
+        fill_database(engine, args.count_si)
+        print(f'{"поиск":<16}{"найдено":>10}{"LIKE, мс":>12}'
+              f'{"FTS5, мс":>12}{"ускорение":>12}')
+        for value in SEARCHES:
+            total_like, like = measure(engine, False, value, args.repeat)
+            total_fts, fts = measure(engine, True, value, args.repeat)
+            print(f'{value:<16}{total_like:>5}/{total_fts:<5}'
+                  f'{like * 1000:>11.1f} {fts * 1000:>11.1f} '
+                  f'{like / fts:>10.1f}x')
+    finally:
+        engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
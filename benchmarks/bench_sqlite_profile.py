@@ -0,0 +1,156 @@
+"""
+Сравнение пропускной способности чтения SQLite при конкурентной записи:
+настройки SQLite по умолчанию против профиля из `settings.SQLITE_PRAGMAS`.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_sqlite_profile --readers 4 --writers 2
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, func, insert, select, update
+
+from src.config import settings
+from src.db.database import Base, apply_sqlite_pragmas
+from src.service.models import Si, Service
+import src.datasource.models  # noqa: F401 регистрация таблиц в Base.metadata
+import src.users.models  # noqa: F401
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+}
+
+
+def create_test_engine(path, pragmas):
+    engine = create_engine(f'sqlite:///{path}')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    return engine
+
+
+def fill_database(engine, count_si):
+    Base.metadata.create_all(engine)
+    date = datetime.date(2020, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Si), [
+            {'number': f'N{i}', 'etalon': False, 'control_vp': False,
+             'is_service': False}
+            for i in range(count_si)
+        ])
+        conn.execute(insert(Service), [
+            {'si_id': i + 1, 'date_in_service': date,
+             'date_next_service': date, 'is_out': True}
+            for i in range(count_si)
+        ])
+
+
+def run(pragmas, args):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = create_test_engine(path, pragmas)
+    try:
+        fill_database(engine, args.count_si)
+        stop = threading.Event()
+        reads = [0] * args.readers
+        writes = [0] * args.writers
+        errors = []
+
+        def reader(index):
+            query = (
+                select(Si.id, Si.number, Service.date_next_service)
+                .join(Service)
+                .order_by(Si.id)
+                .limit(100)
+            )
+            with engine.connect() as conn:
+                while not stop.is_set():
+                    try:
+                        conn.execute(query).all()
+                        conn.execute(
+                            select(func.count()).select_from(Si)
+                        ).scalar()
+                        conn.rollback()
+                    except Exception as e:
+                        errors.append(e)
+                        conn.rollback()
+                        continue
+                    reads[index] += 1
+
+        def writer(index):
+            date = datetime.date(2021, 1, 1)
+            n = 0
+            while not stop.is_set():
+                si_id = (index * 7919 + n) % args.count_si + 1
+                n += 1
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(insert(Service).values(
+                            si_id=si_id, date_in_service=date, is_out=False
+                        ))
+                        conn.execute(
+                            update(Si)
+                            .where(Si.id == si_id)
+                            .values(is_service=True)
+                        )
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                writes[index] += 1
+
+        threads = [
+            threading.Thread(target=reader, args=(i,))
+            for i in range(args.readers)
+        ] + [
+            threading.Thread(target=writer, args=(i,))
+            for i in range(args.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        return {
+            'reads': sum(reads) / args.duration,
+            'writes': sum(writes) / args.duration,
+            'errors': len(errors),
+        }
+    finally:
+        engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count-si', type=int, default=10000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    profiles = {
+        'default': DEFAULT_PRAGMAS,
+        'settings': settings.SQLITE_PRAGMAS,
+    }
+    print(f'{"профиль":<10}{"чтений/с":>12}{"записей/с":>12}{"ошибок":>10}')
+    for name, pragmas in profiles.items():
+        result = run(pragmas, args)
+        print(
+            f'{name:<10}{result["reads"]:>12.1f}'
+            f'{result["writes"]:>12.1f}{result["errors"]:>10}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
 from flask import Blueprint, redirect, url_for, request
 from flask_login import current_user
 
-from src.admin.views import IndexView
+from src.admin.views import IndexView, SlowQueryView
 from src.account.router import router as router_account
 from src.service.router import router_service, router_si
 from src.datasource.router import router as router_datasource
@@ -41,6 +41,13 @@ settings.add_url_rule("/",
                       ))
 
 
+router.add_url_rule("/slow_queries/",
+                    view_func=SlowQueryView.as_view(
+                        name="slow_queries",
+                        blueprint_name=router.name,
+                    ))
+
+
 @router.route('/')
 def index():
     return redirect(url_for('admin.si.list_si'))
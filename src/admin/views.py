@@ -1,4 +1,11 @@
+from flask import abort, current_app, g, redirect, request
+from flask_wtf.csrf import generate_csrf, validate_csrf
+from wtforms.validators import ValidationError
+
+from src.config import settings
 from src.core.mixins import SiteMixin
+from src.db.diagnostics import clear_slow_queries, get_slow_queries
+from src.db.repository import Repository
 
 
 class IndexView(SiteMixin):
@@ -9,3 +16,36 @@ class IndexView(SiteMixin):
         context['app_list'] = self.get_app_list()
 
         return context
+
+
+class SlowQueryView(SiteMixin):
+    """Журнал медленных запросов к БД"""
+    template = 'slow_queries.html'
+    methods = ["GET", "POST"]
+
+    def dispatch_request(self, **kwargs):
+        # Журнал доступен только суперпользователю
+        if not g.user.is_superuser:
+            abort(403)
+        return super().dispatch_request(**kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'csrf_token': generate_csrf(),
+            'title': 'Медленные запросы',
+            'threshold': settings.SLOW_QUERY_MS,
+            'slow_queries': get_slow_queries(),
+            'write_stats': Repository.write_stats(),
+        })
+
+        return context
+
+    def post(self, **kwargs):
+        if current_app.config.get('WTF_CSRF_ENABLED', True):
+            try:
+                validate_csrf(request.form.get('csrf_token'))
+            except ValidationError:
+                abort(400)
+        clear_slow_queries()
+        return redirect(request.path)
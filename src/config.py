@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import Dict, List, Optional
 # from pydantic_settings import BaseSettings, SettingsConfigDict
 
 NAMESUBD = 'sqlite'
@@ -43,6 +43,72 @@ class Settings:
     LANGUAGES: List[str] = ['ru', 'en']
     SITE_NAME: str = 'Средства измерения'
 
+    # Параметры соединения SQLite (PRAGMA), применяются при подключении
+    SQLITE_JOURNAL_MODE: str = 'WAL'
+    SQLITE_SYNCHRONOUS: str = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT: int = 5000  # мс
+    SQLITE_CACHE_SIZE: int = -65536  # отрицательное значение - в КиБ
+    SQLITE_MMAP_SIZE: int = 268435456  # байт
+    SQLITE_TEMP_STORE: str = 'MEMORY'
+    SQLITE_FOREIGN_KEYS: bool = True
+    # Запись в БД: повторы при SQLITE_BUSY с экспоненциальной задержкой (с)
+    # и файл блокировки записи между процессами (None - без блокировки)
+    SQLITE_WRITE_RETRIES: int = 5
+    SQLITE_WRITE_BACKOFF: float = 0.05
+    SQLITE_WRITE_BACKOFF_MAX: float = 1.0
+    SQLITE_WRITE_LOCK_FILE: Optional[str] = None
+
+    # Кэш количества записей списков
+    COUNT_CACHE_SIZE: int = 256
+    # Кэш базовых запросов списков по форме запроса
+    STATEMENT_CACHE_SIZE: int = 128
+
+    # Подсчет запросов к БД на каждый HTTP-запрос
+    QUERY_STATS: bool = True
+    # Заголовок X-DB-Queries в ответе: количество и время запросов видны
+    # любому клиенту, поэтому по умолчанию выводится только в режиме
+    # отладки и тестирования (app.debug, app.testing)
+    QUERY_STATS_HEADER: bool = False
+    # Сколько одинаковых запросов считать признаком проблемы N+1
+    QUERY_N_PLUS_ONE_THRESHOLD: int = 3
+    # Допустимое количество запросов: по умолчанию и для отдельных
+    # представлений (endpoint). При превышении в режиме тестирования
+    # (app.testing) или при QUERY_BUDGET_STRICT возбуждается исключение.
+    # Бюджеты форм СИ измерены в обоих режимах вывода справочников: при
+    # автодополнении (SELECT_LAZY_THRESHOLD) выбранное значение каждого
+    # списка загружается отдельным запросом, сохранение СИ - до 22 запросов
+    QUERY_BUDGET_DEFAULT: Optional[int] = 25
+    QUERY_BUDGETS: Dict[str, int] = {
+        'device.index': 12,
+        'device.view_device': 15,
+        'device.history_device': 3,
+        'admin.si.list_si': 16,
+        'admin.si.change_si': 24,
+        'admin.si.add_si': 24,
+        'admin.service.list_service': 5,
+        'admin.service.history_service': 4,
+    }
+    QUERY_BUDGET_STRICT: bool = False
+
+    # Поиск по теневым столбцам '<столбец>_search': дополнительно к
+    # приведению регистра и "ё" -> "е" выполнять транслитерацию. После
+    # изменения значений выполнить --db_upgrade для пересчета столбцов
+    SEARCH_TRANSLIT: bool = False
+
+    # Справочники, в которых видимых записей больше порога, выводятся в
+    # формах и фильтрах списком с автодополнением: на странице только
+    # выбранное значение, остальные загружаются по запросу
+    # (source.autocomplete). None - всегда выводить все записи
+    SELECT_LAZY_THRESHOLD: Optional[int] = 200
+    AUTOCOMPLETE_LIMIT: int = 20
+    AUTOCOMPLETE_MAX_LIMIT: int = 100
+
+    # Журнал медленных запросов с планом выполнения (EXPLAIN QUERY PLAN).
+    # Записи хранятся в отдельной БД диагностики; None - журнал отключен
+    SLOW_QUERY_MS: Optional[int] = 100
+    SLOW_QUERY_DB: str = os.path.join(BASEDIR, 'db', 'diagnostics.db')
+    SLOW_QUERY_MAX_ROWS: int = 10000
+
     @property
     def DATABASE_URL(self):
         if NAMESUBD == 'sqlite':
@@ -52,6 +118,18 @@ class Settings:
         #     return (f"postgresql+psycopg://{self.DB_USER}:{self.DB_PASS}@"
         #             f"{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}")
 
+    @property
+    def SQLITE_PRAGMAS(self):
+        return {
+            'journal_mode': self.SQLITE_JOURNAL_MODE,
+            'synchronous': self.SQLITE_SYNCHRONOUS,
+            'busy_timeout': self.SQLITE_BUSY_TIMEOUT,
+            'cache_size': self.SQLITE_CACHE_SIZE,
+            'mmap_size': self.SQLITE_MMAP_SIZE,
+            'temp_store': self.SQLITE_TEMP_STORE,
+            'foreign_keys': 'ON' if self.SQLITE_FOREIGN_KEYS else 'OFF',
+        }
+
     # model_config = SettingsConfigDict(env_file=f"{BASEDIR}/../.env")
 
 
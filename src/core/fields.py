@@ -7,31 +7,157 @@ from flask_wtf.file import FileField
 from wtforms.fields.choices import SelectField
 from wtforms.validators import ValidationError
 
+from src.db.cache import choices_cache
 from src.db.repository import Repository
 from src.config import settings
 from src.core.queries import Query
 from . import ALL_VAR
-from .utils import get_model
-from .widgets import ExtendedFileInput
+from .utils import get_model, try_get_url
+from .widgets import ExtendedFileInput, FragmentSelect, OptionsFragment
 
 
 BLANK_CHOICE = [('', '---------')]
 ALL_CHOICE = [(ALL_VAR, 'Не важно')]
 
 
+def load_choices(model_name, limit=None):
+    """
+    Варианты справочника [(id, наименование)] из кэша `choices_cache`.
+    Кэш действует, пока не изменилась версия таблицы справочника, т.е. до
+    записи в нее любым процессом.
+    """
+    model = get_model(model_name)
+    table = model.__tablename__
+    key = (table, limit)
+    choices = choices_cache.get(key, table)
+    if choices is None:
+        query = Query(model=model, filters=[model.view], limit=limit)
+        choices = tuple(
+            (str(obj.id), str(obj))
+            for obj in Repository.task_get_list(q=query)
+        )
+        choices_cache.set(key, table, choices)
+    return list(choices)
+
+
+def get_choices_limit():
+    threshold = settings.SELECT_LAZY_THRESHOLD
+    return None if threshold is None else threshold + 1
+
+
+def prefetch_choices(model_names):
+    """
+    Загрузка в кэш `choices_cache` вариантов нескольких справочников одним
+    запросом (`Repository.task_get_choices`) перед созданием полей формы
+    или фильтров; поля затем получают варианты из кэша.
+    """
+    limit = get_choices_limit()
+    missing = {}
+    for model_name in model_names:
+        model = get_model(model_name)
+        table = model.__tablename__
+        key = (table, limit)
+        if key not in missing and choices_cache.get(key, table) is None:
+            missing[key] = model
+    if not missing:
+        return
+
+    queries = [
+        Query(model=model, filters=[model.view], limit=limit)
+        for model in missing.values()
+    ]
+    results = Repository.task_get_choices(queries)
+    for (key, model), result in zip(missing.items(), results):
+        choices_cache.set(key, model.__tablename__, tuple(
+            (str(obj.id), str(obj)) for obj in result
+        ))
+
+
 def get_choices_for_model(model_name):
+    return load_choices(model_name)
+
+
+def get_limited_choices(model_name):
+    """
+    Варианты справочника или None, если видимых записей больше
+    SELECT_LAZY_THRESHOLD: тогда варианты загружаются по запросу
+    (автодополнение). Проверка выполняется тем же запросом, что и выборка
+    вариантов, с ограничением на одну запись больше порога.
+    """
+    limit = get_choices_limit()
+    choices = load_choices(model_name, limit=limit)
+    if limit is not None and len(choices) >= limit:
+        return None
+    return choices
+
+
+def get_options_fragment(model_name):
+    """
+    Разметка вариантов справочника (`OptionsFragment`) из кэша
+    `choices_cache`, действующая до изменения версии таблицы. None, если
+    варианты загружаются по запросу (автодополнение).
+    """
     model = get_model(model_name)
-    query = Query(model=model, filters=[model.view])
-    choices = [
+    table = model.__tablename__
+    key = (table, get_choices_limit(), 'html')
+    fragment = choices_cache.get(key, table)
+    if fragment is None:
+        choices = get_limited_choices(model_name)
+        if choices is None:
+            return None
+        fragment = OptionsFragment(choices)
+        choices_cache.set(key, table, fragment)
+    return fragment
+
+
+def get_selected_choices(model_name, value):
+    """Вариант для выбранного значения справочника (или пустой список)"""
+    if not value or not str(value).isdigit():
+        return []
+    model = get_model(model_name)
+    query = Query(model=model, filters=[model.view, model.id == int(value)])
+    return [
         (str(obj.id), obj) for obj in Repository.task_get_list(q=query)
     ]
-    return choices
+
+
+def get_autocomplete_url(model_name):
+    return try_get_url(
+        'source.autocomplete', model_name=get_model(model_name).__tablename__
+    )
 
 
 class ExtendedSelectField(SelectField):
+    widget = FragmentSelect()
+
     def __init__(self, model, **kwargs):
         super().__init__(**kwargs)
-        self.choices = BLANK_CHOICE + get_choices_for_model(model)
+        self.model = model
+        self.lazy_data = None
+        choices = get_limited_choices(model)
+        self.lazy = choices is None
+        self.choices = BLANK_CHOICE + (choices or [])
+        self.fixed_choices = len(BLANK_CHOICE)
+        self.options_fragment = None
+        if not self.lazy:
+            self.options_fragment = get_options_fragment(model)
+
+    def __call__(self, **kwargs):
+        if self.lazy:
+            kwargs.setdefault('data-autocomplete', get_autocomplete_url(
+                self.model
+            ))
+        return super().__call__(**kwargs)
+
+    def iter_choices(self):
+        # Для списка с автодополнением выводится только выбранный вариант,
+        # он же проверяется при валидации
+        if self.lazy and self.lazy_data != self.data:
+            self.lazy_data = self.data
+            self.choices = BLANK_CHOICE + get_selected_choices(
+                self.model, self.data
+            )
+        return super().iter_choices()
 
 
 class FilterField:
@@ -46,16 +172,30 @@ class FilterField:
 
 
 class FilterSelectField(FilterField):
-    widget = widgets.Select()
+    widget = FragmentSelect()
 
     def __init__(self, model=None, **kwargs):
         super().__init__(**kwargs)
         self.data = kwargs.get('data')
+        self.autocomplete_url = None
+        self.fixed_choices = len(ALL_CHOICE + BLANK_CHOICE)
+        self.options_fragment = None
         choices = kwargs.get('choices')
         if choices is None and model is not None:
-            choices = BLANK_CHOICE + get_choices_for_model(model)
+            choices = get_limited_choices(model)
+            if choices is None:
+                self.autocomplete_url = get_autocomplete_url(model)
+                choices = get_selected_choices(model, self.data)
+            else:
+                self.options_fragment = get_options_fragment(model)
+            choices = BLANK_CHOICE + choices
         self.choices = ALL_CHOICE + choices
 
+    def __call__(self, **kwargs):
+        if self.autocomplete_url:
+            kwargs.setdefault('data-autocomplete', self.autocomplete_url)
+        return super().__call__(**kwargs)
+
     def iter_choices(self):
         if not self.choices:
             choices = []
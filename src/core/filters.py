@@ -1,17 +1,23 @@
 from flask import g, request
-from sqlalchemy import Boolean, Date
-from sqlalchemy.orm import Relationship
 
-from src.core.constants import FILTER_SUFFIX, LOOKUP_SEP
-from src.core.fields import FilterSelectField, FilterDateField
+from src.core.constants import ALL_VAR, FILTER_SUFFIX, LOOKUP_SEP
+from src.core.fields import (
+    FilterSelectField, FilterDateField, prefetch_choices
+)
 from src.core.utils import label_for_field
+from src.db.registry import get_model_meta
 
 
 class FilterForm:
-    def __init__(self):
+    def __init__(self, facets=None):
         self.fields_filter = g.fields_filter
         self.model = g.model
         self.filters = self.construct_filters()
+        if facets:
+            for filter_ in self.filters:
+                counts = facets.get(filter_.field_name)
+                if counts is not None:
+                    filter_.set_counts(counts)
 
     def __iter__(self):
         return iter(self.filters)
@@ -21,21 +27,18 @@ class FilterForm:
 
     def construct_filters(self):
         filters = []
+        model_meta = get_model_meta(self.model)
+        prefetch_choices(
+            model_meta.path(name).field.property.argument
+            for name in self.fields_filter
+            if model_meta.path(name).filter_type == 'select'
+        )
         for name in self.fields_filter:
-            model = self.model
-            field_name = name
-            if LOOKUP_SEP in name:
-                lookup_fields = name.split(LOOKUP_SEP)
-                for index, field_name in enumerate(lookup_fields):
-                    field = getattr(model, field_name)
-                    if (
-                            isinstance(field.property, Relationship)
-                            and index < len(lookup_fields) - 1
-                    ):
-                        model = field.property.entity.class_
-
-            field = getattr(model, field_name)
-            title = label_for_field(field_name, model=field.class_)
+            path = model_meta.path(name)
+            field = path.field
+            title = path.label or label_for_field(
+                path.field_name, model=field.class_
+            )
 
             filter_name = '%s%s%s' % (name, LOOKUP_SEP, FILTER_SUFFIX)
             id = '%s%sid' % (name, LOOKUP_SEP)
@@ -51,14 +54,10 @@ class FilterForm:
                 }
             }
 
-            if isinstance(field.property, Relationship):
-                filter_ = RelatedListFilter(**kwargs)
-            elif isinstance(field.type, Boolean):
-                filter_ = BooleanListFilter(**kwargs)
-            elif isinstance(field.type, Date):
-                filter_ = DateListFilter(**kwargs)
-            else:
+            filter_class = FILTER_CLASSES.get(path.filter_type)
+            if filter_class is None:
                 raise Exception(f'Фильтра для {field.key} нет')
+            filter_ = filter_class(**kwargs)
 
             filters.append(filter_)
 
@@ -68,7 +67,8 @@ class FilterForm:
 class ListFilter:
     field = None
 
-    def __init__(self, title, options, **kwargs):
+    def __init__(self, field_name, title, options, **kwargs):
+        self.field_name = field_name
         self.title = title
         self.options = options
 
@@ -79,7 +79,27 @@ class ListFilter:
         return self.field()
 
 
-class RelatedListFilter(ListFilter):
+class SelectListFilter(ListFilter):
+    @staticmethod
+    def get_choice_value(value):
+        return '' if value is None else str(value)
+
+    def set_counts(self, counts):
+        """Количество записей в подписях вариантов: 'Значение (5)'"""
+        counts = {
+            self.get_choice_value(value): count
+            for value, count in counts.items()
+        }
+        # Подписи с количеством выводятся без готовой разметки вариантов
+        self.field.options_fragment = None
+        self.field.choices = [
+            (value, label) if value == ALL_VAR
+            else (value, '%s (%s)' % (label, counts.get(value, 0)))
+            for value, label in self.field.choices
+        ]
+
+
+class RelatedListFilter(SelectListFilter):
     def __init__(self, field, **kwargs):
         super().__init__(**kwargs)
         self.type = 'select'
@@ -87,7 +107,7 @@ class RelatedListFilter(ListFilter):
         self.field = FilterSelectField(**self.options)
 
 
-class BooleanListFilter(ListFilter):
+class BooleanListFilter(SelectListFilter):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.type = 'boolean'
@@ -95,10 +115,14 @@ class BooleanListFilter(ListFilter):
         self.options.update(choices=choices)
         self.field = FilterSelectField(**self.options)
 
+    @staticmethod
+    def get_choice_value(value):
+        return None if value is None else str(int(value))
+
 
 class DateListFilter(ListFilter):
     def __init__(self, field_name, **kwargs):
-        super().__init__(**kwargs)
+        super().__init__(field_name, **kwargs)
         self.type = 'date'
         self.fields = self.create_begin_end(field_name)
 
@@ -125,3 +149,10 @@ class DateListFilter(ListFilter):
             fields.append(field)
 
         return fields
+
+
+FILTER_CLASSES = {
+    'select': RelatedListFilter,
+    'boolean': BooleanListFilter,
+    'date': DateListFilter,
+}
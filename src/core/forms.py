@@ -5,6 +5,7 @@ from flask_wtf import FlaskForm
 from werkzeug.datastructures import FileStorage
 
 from . import ExtendedFileField, ExtendedSelectField
+from .fields import prefetch_choices
 from .utils import (
     FIELDS_EXCLUDE,
     label_for_field,
@@ -12,6 +13,7 @@ from .utils import (
     try_get_url,
     upload_for_field,
 )
+from .validators import check_unique
 
 
 class SiteForm(FlaskForm):
@@ -24,6 +26,10 @@ class SiteForm(FlaskForm):
             *args,
             **kwargs
     ):
+        prefetch_choices(
+            unbound.kwargs['model'] for _, unbound in self._unbound_fields
+            if issubclass(unbound.field_class, ExtendedSelectField)
+        )
         super().__init__(obj=obj, *args, **kwargs)
         self.instance = obj or g.model()
         self.readonly_fields = (
@@ -131,9 +137,13 @@ class SiteForm(FlaskForm):
         return result_repr
 
     def validate(self, extra_validators=None):
+        self.unique_results = check_unique(self)
         validate = super().validate(extra_validators)
         self.changed_data = self.check_changed_data()
-        self.instance = self.update_instance()
+        # Данные формы переносятся в объект только после успешной проверки
+        # полей, чтобы объект сессии не изменялся данными неверной формы
+        if validate:
+            self.instance = self.update_instance()
         post_validate = self.post_validate()
 
         return validate and post_validate
@@ -61,10 +61,11 @@ class Media:
 
     @staticmethod
     def merge(*lists):
-        all_items = set()
+        # Порядок подключения сохраняется: скрипты могут зависеть друг от друга
+        all_items = {}
         for list_ in filter(None, lists):
             for item in list_:
-                all_items.add(item)
+                all_items[item] = None
 
         return list(all_items)
 
@@ -7,19 +7,31 @@ from flask import (
 )
 from flask.views import View
 from flask_paginate import Pagination, get_page_parameter
+from markupsafe import Markup, escape
+from sqlalchemy import Boolean
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import Relationship
+from sqlalchemy.orm import InstrumentedAttribute, Relationship
 from werkzeug.routing import BuildError
 
 from src.config import settings
 from src.db.repository import Repository
 from src.core.constants import (
-    EMPTY_VALUE_DISPLAY, LIMIT_PAGE, LOOKUP_SEP, PAGE_VAR, SEARCH_VAR
+    EMPTY_VALUE_DISPLAY,
+    FILTER_SUFFIX,
+    LIMIT_PAGE,
+    LOOKUP_SEP,
+    PAGE_VAR,
+    SEARCH_VAR,
 )
 from src.core.filters import FilterForm
+from src.core.pagination import (
+    CURSOR_NEXT, CURSOR_PREV, KeysetPagination, decode_cursor, encode_cursor
+)
 from src.core.queries import Query
 from src.core.media import Media
 from src.core.utils import (
+    DATE_FORMAT,
+    boolean_icon,
     display_for_field,
     display_for_value,
     format_html,
@@ -27,7 +39,6 @@ from src.core.utils import (
     get_form_class,
     get_model,
     label_for_field,
-    lookup_field,
     try_get_url,
 )
 
@@ -126,7 +137,7 @@ class SiteMixin(View):
         return kwargs
 
     def get_media(self):
-        media = Media()
+        media = Media(js=['js/autocomplete.js'])
 
         return media
 
@@ -151,6 +162,13 @@ class SiteMixin(View):
                     'url': try_get_url('admin.settings.index')
                 },
             ]
+            if g.user.is_superuser:
+                main_menu += [
+                    {
+                        'title': 'Медленные запросы',
+                        'url': try_get_url('admin.slow_queries')
+                    },
+                ]
 
         return main_menu
 
@@ -218,6 +236,10 @@ class IndexMixin(SiteMixin):
         return context
 
 
+# Функции вывода ячеек списков (см. `ListMixin.get_cell_renderers`)
+cell_renderers = {}
+
+
 class ListMixin(SiteMixin):
     template: str = 'list_result.html'
     fields_display: Union[List[str], Tuple[str]] = ()
@@ -225,6 +247,11 @@ class ListMixin(SiteMixin):
     fields_filter: Union[List[str], Tuple[str], None] = ()
     fields_search: Union[List[str], Tuple[str], None] = ()
     per_page: int = LIMIT_PAGE
+    keyset_pagination: bool = False
+    # Записи списка загружаются строками без создания ORM-объектов
+    row_results: bool = False
+    # Количество записей для вариантов фильтров боковой панели
+    facet_counts: bool = False
 
     def g_init(self):
         super().g_init()
@@ -266,21 +293,30 @@ class ListMixin(SiteMixin):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        page = request.args.get(
-            get_page_parameter(param=PAGE_VAR), type=int, default=1
-        )
-        per_page = self.per_page
-        offset = (page - 1) * per_page
-        query = Query(limit=per_page, offset=offset)
-        result_list = self.get_queryset(query)
-        context['pagination'] = self.get_paginator(
-            **{PAGE_VAR: page, 'per_page': per_page}
-        )
+        if self.keyset_pagination:
+            result_list, context['pagination'] = self.get_keyset_page()
+        else:
+            page = request.args.get(
+                get_page_parameter(param=PAGE_VAR), type=int, default=1
+            )
+            per_page = self.per_page
+            offset = (page - 1) * per_page
+            query = Query(
+                limit=per_page,
+                offset=offset,
+                projection=g.fields_display,
+                rows=self.row_results,
+            )
+            result_list, total = self.get_queryset(query)
+            context['pagination'] = self.get_paginator(
+                total=total, **{PAGE_VAR: page, 'per_page': per_page}
+            )
         context['result_headers'] = list(self.get_result_headers())
         context['results'] = list(self.get_results(result_list))
         context['add_url'] = self.get_add_url()
         if self.sidebar == 'filter_sidebar' and g.fields_filter:
-            context['filters'] = FilterForm()
+            facets = self.get_facet_counts() if self.facet_counts else None
+            context['filters'] = FilterForm(facets)
             context['reset_filter_url'] = self.get_reset_filter_url()
 
         if g.fields_search:
@@ -309,21 +345,50 @@ class ListMixin(SiteMixin):
             if f'"{label}"' not in labels:
                 labels.append(f'"{label}"')
         text += ', '.join(labels)
-        return text + '.'
+        return text + (
+            '. Каждое слово ищется как часть значения, без учета регистра; '
+            '"е" и "ё" не различаются.'
+        )
 
-    def get_query(self, query=None):
+    def get_query(self, query=None, params=None):
         if query is None:
             query = Query()
-        if request.args:
-            query += Query(params=request.args, fields_search=g.fields_search)
+        if params is None:
+            params = request.args
+        if params:
+            query += Query(params=params, fields_search=g.fields_search)
         return query
 
+    def get_facet_counts(self):
+        """
+        Количество записей для вариантов каждого фильтра при текущем поиске
+        и остальных фильтрах: {поле фильтра: {значение: количество}}.
+        Подсчет выполняется одним запросом (`Repository.task_get_facets`).
+        """
+        facets = []
+        for name in g.fields_filter:
+            filter_name = '%s%s%s' % (name, LOOKUP_SEP, FILTER_SUFFIX)
+            params = {
+                key: value for key, value in request.args.items()
+                if key != filter_name
+            }
+            query = self.get_query(params=params)
+            column = query.get_facet_column(name)
+            if column is not None:
+                facets.append((name, query, column))
+
+        counts = Repository.task_get_facets(
+            [(query, column) for _, query, column in facets]
+        )
+        return {name: count for (name, _, _), count in zip(facets, counts)}
+
     def get_queryset(self, query):
-        queryset = Repository.task_get_list(q=self.get_query(query))
-        return queryset
+        """Записи текущей страницы и общее количество записей"""
+        return Repository.task_get_page(q=self.get_query(query))
 
-    def get_paginator(self, **kwargs) -> Pagination:
-        total = Repository.task_count(q=self.get_query())
+    def get_paginator(self, total=None, **kwargs) -> Pagination:
+        if total is None:
+            total = Repository.task_count(q=self.get_query())
         return Pagination(
             page_parameter=PAGE_VAR,
             total=total,
@@ -334,6 +399,56 @@ class ListMixin(SiteMixin):
             **kwargs
         )
 
+    def get_keyset_query(self, limit):
+        return Query(
+            limit=limit, projection=g.fields_display, rows=self.row_results
+        )
+
+    def get_keyset_page(self):
+        """
+        Страница при keyset-пагинации: в параметре PAGE_VAR передается токен
+        с ключом сортировки крайней записи соседней страницы, поэтому
+        запрос не пропускает записи через OFFSET.
+        """
+        per_page = self.per_page
+        query = self.get_query(self.get_keyset_query(per_page + 1))
+        cursor = decode_cursor(request.args.get(PAGE_VAR))
+        reverse = False
+        if cursor is not None:
+            values, reverse = cursor
+            try:
+                query.seek(values, reverse=reverse)
+            except (TypeError, ValueError):
+                cursor, reverse = None, False
+                query = self.get_query(self.get_keyset_query(per_page + 1))
+
+        result_list = list(Repository.task_get_list(q=query))
+        has_more = len(result_list) > per_page
+        result_list = result_list[:per_page]
+        if reverse:
+            result_list.reverse()
+            has_prev, has_next = has_more, True
+        else:
+            has_prev, has_next = cursor is not None, has_more
+
+        prev_cursor = next_cursor = None
+        if result_list and has_prev:
+            prev_cursor = encode_cursor(
+                query.get_cursor(result_list[0]), CURSOR_PREV
+            )
+        if result_list and has_next:
+            next_cursor = encode_cursor(
+                query.get_cursor(result_list[-1]), CURSOR_NEXT
+            )
+
+        params = request.args.to_dict(flat=False)
+        params.pop(PAGE_VAR, None)
+        pagination = KeysetPagination(
+            params, len(result_list), prev_cursor, next_cursor
+        )
+
+        return result_list, pagination
+
     @staticmethod
     def get_result_headers():
         """Создание заголовков столбцов таблицы"""
@@ -356,7 +471,30 @@ class ListMixin(SiteMixin):
 
     def items_for_result(self, result):
         """Заполнение строки таблицы"""
+        for render in self.get_cell_renderers():
+            yield render(self, result)
+
+    def get_cell_renderers(self):
+        """
+        Функции вывода ячеек строки для полей `g.fields_display`. Вид поля,
+        ссылка и классы ячейки определяются один раз для класса
+        представления, модели и полей (`cell_renderers`).
+        """
+        fields_link = g.fields_link
+        key = (
+            type(self),
+            g.model,
+            tuple(g.fields_display),
+            None if fields_link is None else tuple(fields_link),
+        )
+        renderers = cell_renderers.get(key)
+        if renderers is None:
+            renderers = cell_renderers[key] = list(
+                self.construct_cell_renderers()
+            )
+        return renderers
 
+    def construct_cell_renderers(self):
         def link_in_col(is_first, field_name):
             if g.fields_link is None:
                 return False
@@ -365,67 +503,116 @@ class ListMixin(SiteMixin):
             return field_name in g.fields_link
 
         first = True
-        empty_value_display = self.empty_value_display
         for field_name in g.fields_display:
-            row_classes = ["field-%s" % field_name]
+            if link_in_col(first, field_name):
+                table_tag = "th" if first else "td"
+                first = False
+                yield self.construct_link_cell(field_name, table_tag)
+            else:
+                yield self.construct_cell(field_name)
+
+    def construct_cell(self, field_name):
+        get_value = self.construct_cell_value(field_name)
+        start = '<td class="field-%s">' % escape(field_name)
+        start_nowrap = '<td class="field-%s nowrap">' % escape(field_name)
+
+        def render(view, result):
+            result_repr, nowrap = get_value(result)
+            return Markup('%s%s</td>' % (
+                start_nowrap if nowrap else start, escape(result_repr)
+            ))
+
+        return render
+
+    def construct_link_cell(self, field_name, table_tag):
+        get_value = self.construct_cell_value(field_name)
+        classes = 'field-%s' % escape(field_name)
+        start = '<%s class="%s">' % (table_tag, classes)
+        start_nowrap = '<%s class="%s nowrap">' % (table_tag, classes)
+        end = '</%s>' % table_tag
+        empty_repr = f'{label_for_field(field_name)} отсутствует'
+
+        def render(view, result):
+            result_repr, nowrap = get_value(result)
             try:
-                f, attr, value = lookup_field(field_name, result)
-            except (AttributeError, ValueError):
-                result_repr = empty_value_display
+                url = view.get_url_for_result(result)
+            except BuildError:
+                link_or_text = escape(result_repr)
             else:
-                if f is None:
-                    boolean = getattr(attr, "boolean", False)
-                    result_repr = display_for_value(
-                        value, empty_value_display, boolean
+                if result_repr:
+                    link_or_text = '<a href="%s">%s</a>' % (
+                        escape(url), escape(result_repr)
                     )
-                    if isinstance(value, (datetime.date, datetime.time)):
-                        row_classes.append("nowrap")
                 else:
-                    if isinstance(f.property, Relationship):
-                        field_val = getattr(result, field_name)
-                        if field_val is None:
-                            result_repr = empty_value_display
-                        else:
-                            result_repr = field_val
-                    else:
-                        result_repr = display_for_field(
-                            value, f, empty_value_display
-                        )
-            row_class = ' class="%s"' % " ".join(row_classes)
+                    link_or_text = '<a href="%s" class="empty">%s</a>' % (
+                        escape(url), escape(empty_repr)
+                    )
+            return Markup('%s%s%s' % (
+                start_nowrap if nowrap else start, link_or_text, end
+            ))
 
-            if link_in_col(first, field_name):
-                table_tag = "th" if first else "td"
-                first = False
+        return render
 
+    def construct_cell_value(self, field_name):
+        """
+        Функция значения ячейки поля: (представление значения, является ли
+        значение метода датой или временем). Вид поля - метод, отношение,
+        логический столбец, файл или столбец - определяется при создании.
+        """
+        empty_value_display = self.empty_value_display
+        field = getattr(g.model, field_name, None)
+
+        def method_value(attr):
+            value = attr() if callable(attr) else attr
+            result_repr = display_for_value(
+                value,
+                empty_value_display,
+                getattr(attr, "boolean", False),
+            )
+            return result_repr, isinstance(
+                value, (datetime.date, datetime.time)
+            )
+
+        def guard(get_value):
+            def value_or_empty(result):
                 try:
-                    url = self.get_url_for_result(result)
-                except BuildError:
-                    link_or_text = result_repr
-                else:
-                    link_class = ''
-                    if not result_repr:
-                        link_class = "empty"
-                        label = label_for_field(field_name)
-                        result_repr = f'{label} отсутствует'
-
-                    link_or_text = format_html(
-                        '<a href="{}"{}>{}</a>',
-                        url,
-                        format_html(' class="{}"', link_class)
-                        if link_class
-                        else '',
-                        result_repr,
-                    )
+                    return get_value(result)
+                except (AttributeError, ValueError):
+                    return empty_value_display, False
+            return value_or_empty
+
+        if not isinstance(field, InstrumentedAttribute):
+            return guard(
+                lambda result: method_value(getattr(result, field_name))
+            )
 
-                yield format_html(
-                    "<{}{}>{}</{}>",
-                    table_tag,
-                    row_class,
-                    link_or_text,
-                    table_tag
-                )
-            else:
-                yield format_html('<td{}>{}</td>', row_class, result_repr)
+        if isinstance(field.property, Relationship):
+            def display(value):
+                return empty_value_display if value is None else value
+        elif isinstance(getattr(field, 'type', None), Boolean):
+            icons = {value: boolean_icon(value) for value in (True, False)}
+            icons[None] = boolean_icon(None)
+            display = icons.__getitem__
+        elif field.info.get('type') == 'FileField':
+            def display(value):
+                return display_for_field(value, field, empty_value_display)
+        else:
+            def display(value):
+                if value is None:
+                    return empty_value_display
+                if isinstance(value, datetime.date):
+                    return value.strftime(DATE_FORMAT)
+                return display_for_value(value, empty_value_display)
+
+        def column_value(result):
+            value = getattr(result, field_name)
+            if callable(value):
+                # Метод строки списка (см. `RowLoader`), когда атрибут класса
+                # модели заменен полем связанной модели
+                return method_value(value)
+            return display(value), False
+
+        return guard(column_value)
 
 
 class ObjectMixin(SiteMixin):
@@ -559,10 +746,11 @@ class FormMixin(ObjectMixin):
         if form.validate_on_submit():
             if form.has_changed():
                 obj = form.instance
-                if request.files:
-                    obj = self.change_files(obj)
-                obj = self.pre_save(obj)
-                self.object_save(obj)
+                with Repository.unit_of_work():
+                    if request.files:
+                        obj = self.change_files(obj)
+                    obj = self.pre_save(obj)
+                    self.object_save(obj)
 
                 message = self.get_success_message(obj)
                 category = 'success'
@@ -641,8 +829,9 @@ class DeleteMixin(ObjectMixin):
 
     def post(self, **kwargs):
         obj = g.object
-        self.delete_files(g.model.__table__.columns, obj)
-        Repository.task_delete_object(obj)
+        with Repository.unit_of_work():
+            self.delete_files(g.model.__table__.columns, obj)
+            Repository.task_delete_object(obj)
 
         message = self.get_success_message(obj)
         flash(message, category='success')
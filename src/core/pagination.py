@@ -0,0 +1,82 @@
+from itsdangerous import BadData, URLSafeSerializer
+from markupsafe import Markup
+from urllib.parse import urlencode
+
+from src.config import settings
+from src.core.constants import PAGE_VAR
+from src.core.utils import format_html
+
+CURSOR_NEXT = 'n'
+CURSOR_PREV = 'p'
+
+cursor_serializer = URLSafeSerializer(settings.SECRET_KEY, salt='cursor')
+
+
+def encode_cursor(values, direction=CURSOR_NEXT):
+    return cursor_serializer.dumps([direction, values])
+
+
+def decode_cursor(token):
+    """Значения ключа записи и направление из токена страницы"""
+    if not token:
+        return None
+    try:
+        direction, values = cursor_serializer.loads(token)
+    except (BadData, TypeError, ValueError):
+        return None
+    if direction not in (CURSOR_NEXT, CURSOR_PREV):
+        return None
+
+    return values, direction == CURSOR_PREV
+
+
+class KeysetPagination:
+    """
+    Пагинация по ключу (seek): ссылки на предыдущую и следующую страницы
+    содержат токен с ключом первой/последней записи текущей страницы.
+    Разметка совместима с `flask_paginate.Pagination` (bootstrap5).
+    """
+    display_msg = 'показано <b>{count}</b> записей'
+
+    def __init__(self, params, count, prev_cursor=None, next_cursor=None):
+        self.params = params
+        self.count = count
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    def get_url(self, cursor):
+        params = dict(self.params)
+        params[PAGE_VAR] = cursor
+        return '?' + urlencode(params, doseq=True)
+
+    def link(self, cursor, text, label):
+        if cursor is None:
+            return format_html(
+                '<li class="page-item disabled"><a class="page-link">{}</a>'
+                '</li>',
+                Markup(text)
+            )
+        return format_html(
+            '<li class="page-item"><a class="page-link" href="{}" '
+            'aria-label="{}"><span aria-hidden="true">{}</span></a></li>',
+            self.get_url(cursor),
+            label,
+            Markup(text),
+        )
+
+    @property
+    def info(self):
+        return Markup('<div class="pagination-page-info">{}</div>'.format(
+            self.display_msg.format(count=self.count)
+        ))
+
+    @property
+    def links(self):
+        if self.prev_cursor is None and self.next_cursor is None:
+            return ''
+        return Markup(
+            '<nav aria-label="..."><ul class="pagination">{}{}</ul></nav>'
+        ).format(
+            self.link(self.prev_cursor, '&laquo;', 'Previous'),
+            self.link(self.next_cursor, '&raquo;', 'Next'),
+        )
@@ -1,13 +1,29 @@
 import datetime
 
 from flask import g
-from sqlalchemy import Boolean, desc, or_
-from sqlalchemy.orm import Relationship
+from sqlalchemy import Boolean, Date, DateTime, and_, desc, false, or_
+from sqlalchemy.sql.util import find_tables
 from typing import Union, List, Tuple
 
 from src.core.constants import ALL_VAR, FILTER_SUFFIX, LOOKUP_SEP, SEARCH_VAR
 from src.core.exceptions import ModelDoesNotExist
 from src.core.utils import convert_quoted_string
+from src.db.database import get_search_column, normalize_search
+from src.db.registry import get_model_meta, is_to_many, split_relations
+
+
+def semi_join(relations, criterion):
+    """
+    Условие по связанным записям без соединения: вложенные EXISTS
+    (`any` для отношений "ко многим", `has` для отношений "к одному"),
+    строки основной модели не размножаются.
+    """
+    for relation in reversed(relations):
+        if is_to_many(relation):
+            criterion = relation.any(criterion)
+        else:
+            criterion = relation.has(criterion)
+    return criterion
 
 
 class Query:
@@ -22,14 +38,19 @@ class Query:
             joins: Union[list, None] = None,
             limit: int = None,
             offset: int = 0,
+            projection: Union[List[str], Tuple[str], None] = None,
+            rows: bool = False,
     ):
         self.model = model or getattr(g, 'model', None)
         if self.model is None:
             raise ModelDoesNotExist('Не найдена модель для запроса')
         self.fields_search = [] if fields_search is None else fields_search
-        self.ordering = self.get_ordering(ordering)
+        self.ordering_fields = self.get_ordering_fields(ordering)
+        self.ordering = self.get_ordering()
         self.limit = limit
         self.offset = offset
+        self.projection = tuple(projection) if projection else None
+        self.rows = rows
         self.filters = list(filters) if filters else []
         self.outer_joins = set(outer_joins) if outer_joins else set()
         self.joins = set(joins) if joins else set()
@@ -37,35 +58,109 @@ class Query:
             self.params = dict(params)
             self.construct_query()
 
-    def get_ordering(self, fields=None):
+    def get_ordering_fields(self, fields=None):
+        """
+        Поля сортировки в виде пар (поле, по возрастанию). Последним всегда
+        добавляется `id`, чтобы порядок записей был однозначным.
+        """
         if fields is None:
             try:
                 fields = getattr(g, 'ordering')
             except AttributeError:
                 fields = getattr(self.model.Meta, 'ordering', [])
 
-        def create_ordering():
-            for field in fields:
-                asc_desc = True
-                if field.startswith("-"):
-                    asc_desc = False
-                    field = field[1:]
-                if not hasattr(self.model, field):
-                    continue
-                if asc_desc:
-                    yield getattr(self.model, field)
-                else:
-                    yield desc(getattr(self.model, field))
+        ordering_fields = []
+        for field in fields:
+            asc_desc = True
+            if field.startswith("-"):
+                asc_desc = False
+                field = field[1:]
+            if not hasattr(self.model, field):
+                continue
+            ordering_fields.append((getattr(self.model, field), asc_desc))
+
+        if not any(field.key == 'id' for field, _ in ordering_fields):
+            ordering_fields.append((self.model.id, True))
+
+        return ordering_fields
+
+    def get_ordering(self):
+        return [
+            field if asc_desc else desc(field)
+            for field, asc_desc in self.ordering_fields
+        ]
+
+    def get_cursor(self, obj):
+        """Значения полей сортировки записи для токена keyset-пагинации"""
+        values = []
+        for field, _ in self.ordering_fields:
+            value = getattr(obj, field.key)
+            if isinstance(field.type, (Date, DateTime)) and value is not None:
+                value = value.isoformat()
+            values.append(value)
+
+        return values
+
+    def parse_cursor(self, values):
+        if len(values) != len(self.ordering_fields):
+            raise ValueError('Неверный ключ страницы')
+        result = []
+        for (field, _), value in zip(self.ordering_fields, values):
+            if value is not None and isinstance(field.type, DateTime):
+                value = datetime.datetime.fromisoformat(value)
+            elif value is not None and isinstance(field.type, Date):
+                value = datetime.date.fromisoformat(value)
+            result.append(value)
+
+        return result
+
+    def seek(self, values, reverse=False):
+        """
+        Фильтр keyset-пагинации: записи, следующие по порядку сортировки за
+        записью с ключом `values` (при `reverse` - предшествующие ей, порядок
+        сортировки при этом меняется на обратный).
+        В SQLite NULL меньше любого значения.
+        """
+        values = self.parse_cursor(values)
+        if reverse:
+            self.ordering_fields = [
+                (field, not asc_desc)
+                for field, asc_desc in self.ordering_fields
+            ]
+            self.ordering = self.get_ordering()
+
+        def equal(field, value):
+            return field.is_(None) if value is None else field == value
+
+        def after(field, asc_desc, value):
+            if asc_desc:
+                return field.is_not(None) if value is None else field > value
+            if value is None:
+                return false()
+            return or_(field < value, field.is_(None))
 
-        return list(create_ordering())
+        or_queries = []
+        for index, (field, asc_desc) in enumerate(self.ordering_fields):
+            equal_queries = [
+                equal(f, v)
+                for (f, _), v in zip(self.ordering_fields[:index], values)
+            ]
+            or_queries.append(
+                and_(*equal_queries, after(field, asc_desc, values[index]))
+            )
+
+        self.filters.append(or_(*or_queries))
 
     def __add__(self, other):
         combined = Query()
         combined.model = self.model
         combined.fields_search = self.fields_search[:]
+        combined.ordering_fields = self.ordering_fields[:]
         combined.ordering = self.ordering[:]
         combined.limit = self.limit
         combined.offset = self.offset
+        combined.projection = self.projection or other.projection
+        combined.rows = self.rows or other.rows
         combined.filters = self.filters[:]
         combined.outer_joins = self.outer_joins.union(other.outer_joins)
         combined.joins = self.joins.union(other.joins)
@@ -74,7 +169,61 @@ class Query:
                 combined.filters.append(item)
         return combined
 
+    def get_shape(self):
+        """
+        Форма запроса без фильтров и страницы: модель, соединения,
+        сортировка и загружаемые поля. Ключ кэша базовых запросов
+        `Repository.get_select`.
+        """
+        return (
+            self.model,
+            self.projection,
+            self.rows,
+            tuple(sorted(str(j) for j in self.outer_joins)),
+            tuple(sorted(str(j) for j in self.joins)),
+            tuple(
+                (str(field), asc_desc)
+                for field, asc_desc in self.ordering_fields
+            ),
+        )
+
+    def get_signature(self):
+        """
+        Нормализованная сигнатура условий запроса: модель, соединения и
+        фильтры со значениями параметров. Не зависит от сортировки и
+        страницы, используется как ключ кэша количества записей.
+        """
+        def clause_key(clause):
+            compiled = clause.compile()
+            params = tuple(sorted(
+                (key, repr(value)) for key, value in compiled.params.items()
+            ))
+            return str(compiled), params
+
+        return (
+            self.model.__name__,
+            tuple(sorted(str(j) for j in self.outer_joins)),
+            tuple(sorted(str(j) for j in self.joins)),
+            tuple(sorted(clause_key(f) for f in self.filters)),
+        )
+
+    def get_tables(self):
+        """Имена таблиц, от данных которых зависит результат запроса"""
+        tables = {self.model.__table__.name}
+        for j in self.outer_joins | self.joins:
+            tables.add(j.property.mapper.local_table.name)
+        for f in self.filters:
+            tables.update(
+                table.name for table in find_tables(f, check_columns=True)
+                if hasattr(table, 'name')
+            )
+
+        return tables
+
     def construct_query(self):
+        # Условия по отношениям "ко многим", сгруппированные по пути, чтобы
+        # условия одного пути проверялись для одной связанной записи
+        self.semi_join_filters = {}
         for param, value in self.params.items():
             if param == SEARCH_VAR and value.strip():
                 self.query_search(value)
@@ -91,24 +240,35 @@ class Query:
                 else:
                     self.query_filter_related(filter_name, value)
 
+        for relations, filters in self.semi_join_filters.items():
+            self.filters.append(semi_join(relations, and_(*filters)))
+
     def lookup_field_related(self, model, field_name):
+        """
+        Модель и имя последнего поля пути. Отношения "к одному" в начале
+        пути присоединяются к запросу, остальные возвращаются для проверки
+        условия через EXISTS (см. `add_filter`).
+        """
+        semi_joins = ()
         if LOOKUP_SEP in field_name:
-            lookup_fields = field_name.split(LOOKUP_SEP)
-            for index, path_part in enumerate(lookup_fields):
-                field_name = path_part
-                field = getattr(model, path_part)
-                if (
-                        isinstance(field.property, Relationship)
-                        and index < len(lookup_fields) - 1
-                ):
-                    model = field.property.entity.class_
-                    self.joins.add(field)
+            path = get_model_meta(model).path(field_name)
+            joins, semi_joins = split_relations(path.joins)
+            self.joins.update(joins)
+            model, field_name = path.model, path.field_name
 
-        return model, field_name
+        return model, field_name, tuple(semi_joins)
+
+    def add_filter(self, filter_, semi_joins=()):
+        if semi_joins:
+            self.semi_join_filters.setdefault(semi_joins, []).append(filter_)
+        else:
+            self.filters.append(filter_)
 
     def query_filter_related(self, field_name, value):
         model = self.model
-        model, field_name = self.lookup_field_related(model, field_name)
+        model, field_name, semi_joins = self.lookup_field_related(
+            model, field_name
+        )
 
         try:
             field = getattr(model, field_name + '_id')
@@ -120,14 +280,36 @@ class Query:
             field = getattr(self.model, field_name)
             if isinstance(field.type, Boolean):
                 filter_ = field == int(value)
+                semi_joins = ()
             else:
                 return
 
-        self.filters.append(filter_)
+        self.add_filter(filter_, semi_joins)
+
+    def get_facet_column(self, field_name):
+        """
+        Столбец, по значениям которого подсчитываются записи для вариантов
+        фильтра `field_name`. None, если путь фильтра проходит через
+        отношение "ко многим".
+        """
+        model, name, semi_joins = self.lookup_field_related(
+            self.model, field_name
+        )
+        if semi_joins:
+            return None
+        column = getattr(model, name + '_id', None)
+        if column is None:
+            column = getattr(model, name)
+            if not isinstance(column.type, Boolean):
+                return None
+
+        return column
 
     def query_filter_date(self, name, value):
         name = name.rsplit(LOOKUP_SEP, maxsplit=1)
-        model, field_name = self.lookup_field_related(self.model, name[0])
+        model, field_name, semi_joins = self.lookup_field_related(
+            self.model, name[0]
+        )
         field = getattr(model, field_name)
         value = datetime.datetime.strptime(value, "%Y-%m-%d").date()
         if name[-1] == 'begin':
@@ -135,7 +317,19 @@ class Query:
         else:
             filter_ = field <= value
 
-        self.filters.append(filter_)
+        self.add_filter(filter_, semi_joins)
+
+    @staticmethod
+    def query_contains(search_column, value):
+        """
+        Поиск вхождения в нормализованное значение теневого столбца: как
+        `ilike '%значение%'`, но без учета регистра и для кириллицы, и без
+        различия "е"/"ё" (см. `normalize_search`).
+        """
+        value = normalize_search(value)
+        for char in ('\\', '%', '_'):
+            value = value.replace(char, '\\' + char)
+        return search_column.like(f'%{value}%', escape='\\')
 
     def query_search(self, value: str):
         values = [
@@ -143,17 +337,40 @@ class Query:
             if s.startswith(('"', "'")) and s[0] == s[-1] else s
             for s in value.split(' ')
         ]
+        search_index = get_model_meta(self.model).search_index
+        if (
+                search_index is not None
+                and search_index.covers(self.fields_search)
+                and search_index.is_ready()
+        ):
+            # Слова, которые индекс находит по триграммам, ищутся одним
+            # условием MATCH, короткие - по теневым столбцам, как без индекса
+            fields = self.fields_search
+            if set(fields) == set(search_index.fields):
+                fields = None
+            indexed = [v for v in values if search_index.can_match(v)]
+            if indexed:
+                self.filters.append(search_index.match(indexed, fields))
+            values = [v for v in values if not search_index.can_match(v)]
+
         for value in values:
             or_queries = []
+            model_meta = get_model_meta(self.model)
             for field_name in self.fields_search:
-                model = self.model
-                lookup_fields = field_name.split(LOOKUP_SEP)
-                for path_part in lookup_fields:
-                    field = getattr(model, path_part)
-                    if isinstance(field.property, Relationship):
-                        model = field.property.entity.class_
-                        self.outer_joins.add(field)
-                        continue
-                    or_queries.append(field.ilike(f'%{value}%'))
+                path = model_meta.path(field_name)
+                outer_joins, semi_joins = split_relations(path.relations)
+                self.outer_joins.update(outer_joins)
+                conditions = []
+                for field in path.columns:
+                    search_column = get_search_column(field)
+                    if search_column is None:
+                        conditions.append(field.ilike(f'%{value}%'))
+                    else:
+                        conditions.append(
+                            self.query_contains(search_column, value)
+                        )
+                if semi_joins and conditions:
+                    conditions = [semi_join(semi_joins, or_(*conditions))]
+                or_queries.extend(conditions)
 
             self.filters.append(or_(*or_queries))
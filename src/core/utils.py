@@ -280,6 +280,10 @@ def lookup_field(name, obj):
     else:
         attr = None
         value = getattr(obj, name)
+        if callable(value):
+            # Метод строки списка (см. `RowLoader`), когда атрибут класса
+            # модели заменен полем связанной модели
+            attr, value, f = value, value(), None
     return f, attr, value
 
 
@@ -3,45 +3,81 @@ from flask_login import current_user
 from werkzeug.datastructures import FileStorage
 from wtforms.validators import ValidationError
 
-from src.core import secure_filename
+from src.core.utils import secure_filename
 from src.db.repository import Repository
 
 
-class Unique:
+def get_unique_filters(model, instance, field, value):
+    column = getattr(model, field.name)
+    filters = [column == value]
+    # Поле может принадлежать связанной модели (например, сертификат
+    # текущего обслуживания СИ), тогда запись формы не исключается
+    if column.class_ is model:
+        filters.append(model.id != instance.id)
+    return filters
+
+
+def check_unique(form):
+    """
+    Проверка всех ограничений Unique/UniqueFile полей формы одним запросом.
+    Результат - словарь {(имя поля, валидатор): запись существует},
+    который используют валидаторы при проверке полей.
+    """
+    keys, filters_list = [], []
+    for field in form:
+        for validator in field.validators:
+            if not isinstance(validator, (Unique, UniqueFile)):
+                continue
+            filters = validator.get_filters(form, field)
+            if filters is None:
+                continue
+            keys.append((field.name, id(validator)))
+            filters_list.append(filters)
+
+    if not filters_list:
+        return {}
+    return dict(zip(keys, Repository.task_exists_many(filters_list)))
+
+
+class UniqueMixin:
+    def get_filters(self, form, field):
+        raise NotImplementedError
+
+    def exists(self, form, field):
+        results = getattr(form, 'unique_results', None) or {}
+        key = (field.name, id(self))
+        if key in results:
+            return results[key]
+        # Форма без общей проверки уникальности: отдельный запрос
+        filters = self.get_filters(form, field)
+        return filters is not None and Repository.task_exists(filters)
+
+    def __call__(self, form, field):
+        if self.exists(form, field):
+            raise ValidationError(self.message)
+
+
+class Unique(UniqueMixin):
     def __init__(self, message=None):
         if not message:
             message = 'Такая запись уже существует'
         self.message = message
 
-    def __call__(self, form, field):
-        model, instance = g.model, form.instance
-        filters = [
-            getattr(model, field.name) == field.data,
-            model.id != instance.id,
-        ]
-        if Repository.task_exists(filters):
-            raise ValidationError(self.message)
+    def get_filters(self, form, field):
+        return get_unique_filters(g.model, form.instance, field, field.data)
 
 
-class UniqueFile:
+class UniqueFile(UniqueMixin):
     def __init__(self, message=None):
         if not message:
             message = 'Такой файл уже существует'
         self.message = message
 
-    def __call__(self, form, field):
-        model, instance = g.model, form.instance
+    def get_filters(self, form, field):
         if not isinstance(field.data, FileStorage):
-            return
+            return None
         filename = secure_filename(field.data.filename)
-
-        filters = [
-            model.id != instance.id,
-            getattr(model, field.name) == filename
-        ]
-
-        if Repository.task_exists(filters):
-            raise ValidationError(self.message)
+        return get_unique_filters(g.model, form.instance, field, filename)
 
 
 class OldPassword:
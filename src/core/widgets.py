@@ -1,5 +1,7 @@
+import itertools
+
 from markupsafe import Markup
-from wtforms.widgets.core import html_params, FileInput
+from wtforms.widgets.core import html_params, FileInput, Select
 
 
 class DivWidget:
@@ -38,3 +40,60 @@ class ExtendedFileInput(FileInput):
             input_ = Markup(html) + input_ + Markup('</div></div>')
 
         return input_
+
+
+class OptionsFragment:
+    """
+    Готовая разметка вариантов списка выбора. Выбранный вариант отмечается
+    заменой его разметки по позиции во фрагменте, остальные варианты
+    повторно не выводятся.
+    """
+
+    def __init__(self, choices):
+        html = []
+        self.positions = {}
+        start = 0
+        for value, label in choices:
+            option = Select.render_option(value, label, False)
+            self.positions[value] = (start, start + len(option), label)
+            html.append(option)
+            start += len(option)
+        self.html = Markup('').join(html)
+
+    def render(self, selected=None):
+        position = self.positions.get(selected)
+        if position is None:
+            return self.html
+        start, end, label = position
+        option = Select.render_option(selected, label, True)
+        return self.html[:start] + option + self.html[end:]
+
+
+class FragmentSelect(Select):
+    """
+    Список выбора, варианты справочника которого выводятся готовым
+    фрагментом `field.options_fragment` (`OptionsFragment`), а начальные
+    варианты (`field.fixed_choices` первых) - как обычно.
+    """
+
+    def __call__(self, field, **kwargs):
+        fragment = getattr(field, 'options_fragment', None)
+        if fragment is None:
+            return super().__call__(field, **kwargs)
+
+        kwargs.setdefault("id", field.id)
+        flags = getattr(field, "flags", {})
+        for k in dir(flags):
+            if k in self.validation_attrs and k not in kwargs:
+                kwargs[k] = getattr(flags, k)
+        html = ["<select %s>" % html_params(name=field.name, **kwargs)]
+        for choice in itertools.islice(
+                field.iter_choices(), field.fixed_choices
+        ):
+            val, label, selected, *render_kw = choice
+            html.append(self.render_option(
+                val, label, selected, **(render_kw[0] if render_kw else {})
+            ))
+        html.append(fragment.render(field.data))
+        html.append("</select>")
+        return Markup("".join(html))
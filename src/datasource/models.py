@@ -15,13 +15,14 @@ class BaseView(BasePK):
 
 class BaseViewName(BaseView):
     name: Mapped[str_256] = mapped_column(
-        info={'label': 'Наименование'},
+        info={'label': 'Наименование', 'search': True},
         unique=True
     )
 
     class Meta:
         ordering = ('name',)
         fields_display = ('name',)
+        fields_depends = {'__str__': ('name',)}
         fields_search = ('name',)
 
     def __str__(self):
@@ -171,13 +172,13 @@ class Employee(BaseView, Base):
     __tablename__ = "employee"
 
     last_name: Mapped[str_100] = mapped_column(
-        info={'label': 'Фамилия'}
+        info={'label': 'Фамилия', 'search': True}
     )
     first_name: Mapped[Optional[str_100]] = mapped_column(
-        info={'label': 'Имя'}
+        info={'label': 'Имя', 'search': True}
     )
     middle_name: Mapped[Optional[str_100]] = mapped_column(
-        info={'label': 'Отчество'}
+        info={'label': 'Отчество', 'search': True}
     )
     email: Mapped[Optional[str]] = mapped_column(
         unique=True,
@@ -198,6 +199,9 @@ class Employee(BaseView, Base):
         ordering = ('last_name', 'first_name', 'middle_name')
         joined_related = ('division',)
         fields_display = ('__str__', 'email', 'division')
+        fields_depends = {
+            '__str__': ('last_name', 'first_name', 'middle_name'),
+        }
         fields_search = (
             'last_name', 'first_name', 'middle_name', 'division__name'
         )
@@ -0,0 +1,264 @@
+import threading
+from collections import OrderedDict
+
+from flask import g, has_app_context
+from sqlalchemy import (
+    Column, Delete, Insert, Integer, String, Table, Update, event, insert,
+    select, update
+)
+from sqlalchemy.orm import Session
+
+from src.config import settings
+from src.db.database import Base, get_session
+from src.db.writer import WRITE_TRANSACTION
+
+
+class TableCache:
+    """
+    Ограниченный по размеру LRU-кэш значений, зависящих от таблиц БД.
+
+    При `versioned` каждое значение хранится вместе с версиями таблиц
+    (`get_table_versions`), из которых оно получено, и используется, пока
+    версии не изменились: запись в таблицу любым процессом увеличивает ее
+    версию. Запись в этом процессе, кроме того, сразу удаляет значение из
+    кэша (`invalidate`). Значения без таблиц вытесняются только по размеру.
+    """
+
+    def __init__(self, maxsize=256, versioned=True):
+        self.maxsize = maxsize
+        self.versioned = versioned
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        # Версии читаются до значения и вне блокировки: первое обращение в
+        # запросе выполняет запрос к БД
+        current = get_table_versions() if self.versioned else {}
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, tables, versions = item
+                if versions == tuple(
+                        current.get(table, 0) for table in tables
+                ):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+
+        return None
+
+    def set(self, key, value, tables):
+        # Версии в запросе прочитаны в `get`, до значения, поэтому значение
+        # не старше версий, с которыми сохраняется
+        tables = tuple(sorted(tables))
+        current = get_table_versions() if self.versioned else {}
+        versions = tuple(current.get(table, 0) for table in tables)
+        with self._lock:
+            self._data[key] = (value, tables, versions)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, tables=None):
+        with self._lock:
+            if tables is None:
+                self._data.clear()
+                return
+            tables = set(tables)
+            for key in [
+                key for key, (_, key_tables, _) in self._data.items()
+                if tables.intersection(key_tables)
+            ]:
+                del self._data[key]
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
+
+
+# Версии таблиц: счетчик увеличивается в той же транзакции, что и запись в
+# таблицу, поэтому изменение видно всем процессам (воркерам gunicorn)
+table_version = Table(
+    'table_version',
+    Base.metadata,
+    Column('table_name', String(100), primary_key=True),
+    Column('version', Integer, nullable=False, default=0),
+)
+
+
+def get_table_versions():
+    """
+    Версии таблиц {имя таблицы: версия}. В контексте приложения читаются
+    из БД один раз за запрос, в сессии запроса: данные, прочитанные после
+    версий, не старше их.
+    """
+    if has_app_context() and 'table_versions' in g:
+        return g.table_versions
+    with get_session() as session:
+        versions = dict(session.execute(
+            select(table_version.c.table_name, table_version.c.version)
+        ).all())
+    if has_app_context():
+        g.table_versions = versions
+    return versions
+
+
+def bump_table_versions(connection, tables):
+    for table in tables:
+        result = connection.execute(
+            update(table_version)
+            .where(table_version.c.table_name == table)
+            .values(version=table_version.c.version + 1)
+        )
+        if not result.rowcount:
+            connection.execute(
+                insert(table_version).values(table_name=table, version=1)
+            )
+
+
+@event.listens_for(table_version, 'after_create')
+def fill_table_versions(target, connection, **kwargs):
+    connection.execute(insert(table_version), [
+        {'table_name': table.name, 'version': 0}
+        for table in Base.metadata.sorted_tables
+        if table is not table_version
+    ])
+
+
+class VersionedCache:
+    """
+    Кэш значений, зависящих от одной таблицы, в памяти процесса.
+
+    Значение хранится вместе с версией таблицы (`get_table_versions`) на
+    момент чтения и используется, пока версия не изменилась. Запись в
+    таблицу любым процессом увеличивает версию, поэтому устаревшие значения
+    не используются ни в одном процессе, без ограничения времени жизни.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, table):
+        version = get_table_versions().get(table, 0)
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] == version:
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+
+        return None
+
+    def set(self, key, table, value):
+        # Версия прочитана до значения (в `get`), поэтому значение не
+        # старше версии, с которой сохраняется
+        version = get_table_versions().get(table, 0)
+        with self._lock:
+            self._data[key] = (version, value)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+        }
+
+
+count_cache = TableCache(maxsize=settings.COUNT_CACHE_SIZE)
+
+# Количество записей по вариантам фильтров (`Repository.task_get_facets`)
+facet_cache = TableCache(maxsize=settings.COUNT_CACHE_SIZE)
+
+# Базовые запросы Query не зависят от данных и не очищаются при записи
+statement_cache = TableCache(
+    maxsize=settings.STATEMENT_CACHE_SIZE, versioned=False
+)
+
+# Варианты списков выбора справочников (`src.core.fields`)
+choices_cache = VersionedCache()
+
+table_caches = [count_cache, facet_cache]
+
+
+def invalidate_caches(tables):
+    for cache in table_caches:
+        cache.invalidate(tables)
+
+
+def get_changed_objects(session):
+    """
+    Объекты, записываемые при flush: новые, удаленные и измененные с
+    действительными изменениями столбцов (не просто затронутые в `dirty`).
+    """
+    yield from session.new
+    yield from session.deleted
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            yield obj
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_flushed_tables(session, flush_context):
+    # Версии и кэши изменяются только в транзакции записи
+    # (`Repository.unit_of_work`), чтение таблиц в БД не пишет
+    if not session.info.get(WRITE_TRANSACTION):
+        return
+    flushed = set()
+    for obj in get_changed_objects(session):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            flushed.add(table.name)
+    if not flushed:
+        return
+    tables = session.info.setdefault('changed_tables', set())
+    bump_table_versions(session.connection(), flushed - tables)
+    tables.update(flushed)
+    invalidate_caches(tables)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def collect_executed_tables(orm_execute_state):
+    statement = orm_execute_state.statement
+    session = orm_execute_state.session
+    if (
+            isinstance(statement, (Insert, Update, Delete))
+            and session.info.get(WRITE_TRANSACTION)
+    ):
+        tables = session.info.setdefault('changed_tables', set())
+        if statement.table.name not in tables:
+            bump_table_versions(session.connection(), [statement.table.name])
+        tables.add(statement.table.name)
+        invalidate_caches(tables)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed_tables(session):
+    session.info.pop(WRITE_TRANSACTION, None)
+    # Повторная очистка: между flush и commit другой запрос мог сохранить
+    # в кэше значение, вычисленное по еще не зафиксированным данным
+    tables = session.info.pop('changed_tables', None)
+    if tables:
+        invalidate_caches(tables)
+        # Версии таблиц перечитываются при следующем обращении
+        if has_app_context():
+            g.pop('table_versions', None)
+
+
+@event.listens_for(Session, 'after_rollback')
+def clear_changed_tables(session):
+    session.info.pop(WRITE_TRANSACTION, None)
+    session.info.pop('changed_tables', None)
@@ -1,6 +1,10 @@
 import datetime
+from contextlib import contextmanager
 
-from sqlalchemy import create_engine, func, String, text
+from flask import g, has_app_context
+from sqlalchemy import (
+    Column, create_engine, event, func, Index, String, text
+)
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Mapped, mapped_column
 from typing_extensions import Annotated
 
@@ -11,8 +15,57 @@ engine = create_engine(
     # echo=True,
 )
 
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        if value is None:
+            continue
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+if NAMESUBD == 'sqlite':
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, settings.SQLITE_PRAGMAS)
+
+
 session_factory = sessionmaker(engine)
 
+
+@contextmanager
+def get_session():
+    """
+    Сессия БД для текущего запроса.
+
+    В контексте приложения сессия создается один раз, хранится в `g` и
+    закрывается в `close_session` при завершении контекста. Вне контекста
+    приложения (команды запуска, конвертация БД) сессия закрывается сразу.
+
+    Сессия запроса создается без autoflush: изменения объектов (например,
+    данные формы, не прошедшей проверку) не записываются в БД при чтении,
+    запись выполняется только явно внутри `Repository.unit_of_work`.
+    """
+    if not has_app_context():
+        with session_factory() as session:
+            yield session
+        return
+
+    if 'db_session' not in g:
+        g.db_session = session_factory(autoflush=False)
+    yield g.db_session
+
+
+def close_session(exception=None):
+    session = g.pop('db_session', None)
+    if session is None:
+        return
+    if exception is not None:
+        session.rollback()
+    session.close()
+
+
 if NAMESUBD == 'sqlite':
     created_at = Annotated[datetime.datetime, mapped_column(
         server_default=func.CURRENT_TIMESTAMP()
@@ -28,6 +81,94 @@ str_256 = Annotated[str, 256]
 str_1000 = Annotated[str, 1000]
 
 
+def declare_indexes(table, indexes=()):
+    """
+    Объявление индексов таблицы: по составным индексам из `Meta.indexes`
+    модели и по каждому внешнему ключу, который не является первым столбцом
+    уже объявленного индекса. Для отказа от индекса по внешнему ключу в `info`
+    столбца указывается `'index': False`.
+    """
+    declared = [tuple(columns) for columns in indexes]
+    for column in table.columns:
+        if (
+                not column.foreign_keys
+                or column.index
+                or column.info.get('index') is False
+                or any(columns[0] == column.name for columns in declared)
+        ):
+            continue
+        declared.append((column.name,))
+
+    existing = {index.name for index in table.indexes}
+    for columns in declared:
+        name = 'ix_%s_%s' % (table.name, '_'.join(columns))
+        if name in existing:
+            continue
+        Index(name, *(table.c[column] for column in columns))
+
+
+def normalize_search(value):
+    """
+    Значение для поиска без учета регистра: casefold, "ё" -> "е",
+    схлопнутые пробелы, при SEARCH_TRANSLIT - транслитерация (TRANSTABLE).
+    """
+    if value is None:
+        return None
+    value = ' '.join(str(value).casefold().replace('ё', 'е').split())
+    if settings.SEARCH_TRANSLIT:
+        from src.core.utils import translit
+        value = translit(value)
+    return value
+
+
+def search_column_name(name):
+    return f'{name}_search'
+
+
+def declare_search_columns(cls):
+    """
+    Теневые столбцы для поиска по столбцам с `'search': True` в `info`:
+    `<столбец>_search` с нормализованным значением (`normalize_search`).
+    Столбцы служат только для нормализации и без индекса: поиск вхождения
+    (`LIKE '%...%'`) индекс B-дерева не использует, ускоренный поиск -
+    по триграммному индексу FTS5 (`src.db.fts`). Значение обновляется при
+    присваивании атрибута объекта, а при вставке без ORM (`insert(model)`)
+    - значением по умолчанию столбца.
+    """
+    table = cls.__table__
+    for column in list(table.columns):
+        if not column.info.get('search'):
+            continue
+        name = search_column_name(column.name)
+        if name in table.c:
+            continue
+
+        def default(context, source=column.name):
+            return normalize_search(
+                context.get_current_parameters().get(source)
+            )
+
+        shadow = Column(
+            name,
+            String,
+            default=default,
+            info={'search_source': column.name},
+        )
+        table.append_column(shadow)
+        cls.__mapper__.add_property(name, shadow)
+
+        @event.listens_for(getattr(cls, column.key), 'set')
+        def set_search_value(target, value, oldvalue, initiator, name=name):
+            setattr(target, name, normalize_search(value))
+
+
+def get_search_column(field):
+    """Теневой столбец поиска для атрибута модели или None"""
+    if not field.info.get('search'):
+        return None
+    return getattr(field.class_, search_column_name(field.key), None)
+
+
 class Base(DeclarativeBase):
     type_annotation_map = {
         str_100: String(100),
@@ -40,6 +181,14 @@ class Base(DeclarativeBase):
 
     class Meta:
         action_suffix = ''
+        indexes = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        table = getattr(cls, '__table__', None)
+        if table is not None:
+            declare_search_columns(cls)
+            declare_indexes(table, getattr(cls.Meta, 'indexes', ()))
 
     def __repr__(self):
         cols = []
@@ -0,0 +1,135 @@
+import logging
+import sqlite3
+import threading
+
+from flask import g, has_request_context, request
+
+from src.config import settings, NAMESUBD
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slow_query (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    fingerprint TEXT NOT NULL,
+    statement TEXT NOT NULL,
+    endpoint TEXT,
+    view TEXT,
+    duration_ms REAL NOT NULL,
+    plan TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_slow_query_fingerprint
+    ON slow_query (fingerprint, duration_ms);
+"""
+
+_lock = threading.Lock()
+_connection = None
+
+
+def get_connection():
+    """
+    Соединение с отдельной БД диагностики, чтобы запись медленных запросов
+    не попадала в транзакцию основной БД.
+    """
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(
+            settings.SLOW_QUERY_DB, check_same_thread=False, timeout=1
+        )
+        _connection.executescript(SCHEMA)
+    return _connection
+
+
+def explain_query_plan(cursor, statement, parameters):
+    """План запроса SQLite в виде дерева с отступами"""
+    if NAMESUBD != 'sqlite':
+        return ''
+    try:
+        plan_cursor = cursor.connection.cursor()
+        try:
+            rows = plan_cursor.execute(
+                'EXPLAIN QUERY PLAN ' + statement, parameters or ()
+            ).fetchall()
+        finally:
+            plan_cursor.close()
+    except sqlite3.Error:
+        return ''
+
+    depth = {0: -1}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+
+    return '\n'.join(lines)
+
+
+def record_slow_query(cursor, statement, parameters, duration, fingerprint):
+    endpoint = view = None
+    if has_request_context():
+        endpoint = request.endpoint
+        view_obj = g.get('view')
+        if view_obj is not None:
+            view = type(view_obj).__name__
+    duration_ms = duration * 1000
+    plan = explain_query_plan(cursor, statement, parameters)
+
+    # Параметры запроса не сохраняются и не выводятся в журнал: в них
+    # могут быть хэши паролей и данные пользователей
+    logger.warning(
+        'Медленный запрос %.1f мс (%s, %s): %s\n%s',
+        duration_ms, endpoint, view, statement, plan
+    )
+    with _lock:
+        connection = get_connection()
+        try:
+            with connection:
+                connection.execute(
+                    'INSERT INTO slow_query (fingerprint, statement, '
+                    'endpoint, view, duration_ms, plan) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (fingerprint, statement, endpoint, view, duration_ms,
+                     plan),
+                )
+                # Хранятся только последние SLOW_QUERY_MAX_ROWS записей
+                connection.execute(
+                    'DELETE FROM slow_query WHERE id <= '
+                    '(SELECT MAX(id) FROM slow_query) - ?',
+                    (settings.SLOW_QUERY_MAX_ROWS,),
+                )
+        except sqlite3.Error as e:
+            logger.error('Не удалось сохранить медленный запрос: %s', e)
+
+
+def get_slow_queries(limit=20):
+    """
+    Запросы с наибольшим суммарным временем выполнения, сгруппированные по
+    нормализованному тексту, с текстом и планом самого медленного.
+    """
+    with _lock:
+        connection = get_connection()
+        connection.row_factory = sqlite3.Row
+        try:
+            return connection.execute(
+                'SELECT s.fingerprint, s.count, s.total_ms, s.max_ms, '
+                's.last_at, q.statement, q.endpoint, q.view, '
+                'q.plan '
+                'FROM (SELECT fingerprint, COUNT(*) AS count, '
+                'SUM(duration_ms) AS total_ms, MAX(duration_ms) AS max_ms, '
+                'MAX(created_at) AS last_at FROM slow_query '
+                'GROUP BY fingerprint) AS s '
+                'JOIN slow_query AS q ON q.id = ('
+                'SELECT id FROM slow_query WHERE fingerprint = s.fingerprint '
+                'ORDER BY duration_ms DESC LIMIT 1) '
+                'ORDER BY s.total_ms DESC LIMIT ?',
+                (limit,),
+            ).fetchall()
+        finally:
+            connection.row_factory = None
+
+
+def clear_slow_queries():
+    with _lock:
+        with get_connection() as connection:
+            connection.execute('DELETE FROM slow_query')
@@ -0,0 +1,209 @@
+from sqlalchemy import (
+    bindparam, column, event, literal_column, select, table, text
+)
+
+from src.config import NAMESUBD
+from src.db.database import (
+    Base, engine, get_search_column, normalize_search
+)
+
+
+class SearchIndex:
+    """
+    Полнотекстовый индекс SQLite FTS5 по текстовым полям модели.
+
+    Поля - столбцы модели или столбцы связанных моделей через одно
+    отношение ('name_si__name') с теневыми столбцами поиска
+    (`'search': True`). В индекс попадают нормализованные значения
+    (`normalize_search`), разбитые на триграммы, поэтому слово находится
+    как часть значения - так же, как при поиске без индекса
+    (`Query.query_contains`). Слова короче `MIN_TERM_LENGTH` индекс не
+    находит. Строка индекса с rowid = id записи поддерживается триггерами
+    на таблице модели и на связанных таблицах.
+    """
+
+    MIN_TERM_LENGTH = 3
+
+    def __init__(self, model, fields):
+        from src.db.registry import get_model_meta
+
+        self.model = model
+        self.fields = tuple(fields)
+        self.table_name = model.__table__.name
+        self.name = f'{self.table_name}_fts'
+        self.table = table(self.name, column('rowid'), column('rank'))
+        self.ready = None
+
+        self.columns = []  # (поле, выражение SQL)
+        self.own_columns = []  # столбцы модели, входящие в индекс
+        self.joins = {}  # внешний ключ -> (таблица, псевдоним, столбец)
+        for name in self.fields:
+            path = get_model_meta(model).path(name)
+            search_column = None
+            if len(path.joins) <= 1 and not path.is_relationship:
+                search_column = get_search_column(path.field)
+            if search_column is None:
+                raise ValueError(
+                    f'Поле {name} нельзя добавить в индекс {self.name}'
+                )
+            if not path.joins:
+                self.own_columns.append(search_column.key)
+                self.columns.append(
+                    (name, f'{self.table_name}.{search_column.key}')
+                )
+                continue
+            ((local, remote),) = path.joins[0].property.local_remote_pairs
+            alias = f't_{local.name}'
+            self.joins[local.name] = (remote.table.name, alias, remote.name)
+            self.columns.append((name, f'{alias}.{search_column.key}'))
+
+    def select_rows(self, where):
+        """SQL выборки строк индекса для записей модели по условию"""
+        joins = ''.join(
+            f' LEFT OUTER JOIN {table_name} AS {alias} '
+            f'ON {alias}.{remote} = {self.table_name}.{local}'
+            for local, (table_name, alias, remote) in self.joins.items()
+        )
+        columns = ', '.join(sql for _, sql in self.columns)
+        return (
+            f'INSERT INTO {self.name} (rowid, '
+            f'{", ".join(name for name, _ in self.columns)}) '
+            f'SELECT {self.table_name}.id, {columns} '
+            f'FROM {self.table_name}{joins} WHERE {where};'
+        )
+
+    def ddl(self):
+        name, table_name = self.name, self.table_name
+        update_columns = ', '.join([*self.joins, *self.own_columns])
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+            f"{', '.join(field for field, _ in self.columns)}, "
+            f"tokenize = 'trigram')",
+            f'CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON '
+            f'{table_name} BEGIN '
+            f'{self.select_rows(f"{table_name}.id = NEW.id")} END',
+            f'CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF '
+            f'{update_columns} ON {table_name} BEGIN '
+            f'DELETE FROM {name} WHERE rowid = OLD.id; '
+            f'{self.select_rows(f"{table_name}.id = NEW.id")} END',
+            f'CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON '
+            f'{table_name} BEGIN '
+            f'DELETE FROM {name} WHERE rowid = OLD.id; END',
+        ]
+        for local, (related_table, _, remote) in self.joins.items():
+            where = f'{table_name}.{local} = NEW.{remote}'
+            statements.append(
+                f'CREATE TRIGGER IF NOT EXISTS {name}_{local}_au '
+                f'AFTER UPDATE ON {related_table} BEGIN '
+                f'DELETE FROM {name} WHERE rowid IN (SELECT id FROM '
+                f'{table_name} WHERE {local} = NEW.{remote}); '
+                f'{self.select_rows(where)} END'
+            )
+        # Заполнение индекса для записей, добавленных до его создания
+        statements.append(self.select_rows(
+            f'{table_name}.id NOT IN (SELECT rowid FROM {name})'
+        ).rstrip(';'))
+
+        return statements
+
+    def create(self, connection):
+        for statement in self.ddl():
+            connection.exec_driver_sql(statement)
+        self.ready = True
+
+    def drop(self, connection):
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {self.name}')
+        self.ready = None
+
+    def is_ready(self):
+        """Индекс создан в БД (см. `Repository.upgrade_table`)"""
+        if self.ready is None:
+            with engine.connect() as connection:
+                self.ready = connection.execute(
+                    text(
+                        "SELECT 1 FROM sqlite_master "
+                        "WHERE type = 'table' AND name = :name"
+                    ),
+                    {'name': self.name},
+                ).first() is not None
+        return self.ready
+
+    def covers(self, fields):
+        return bool(fields) and set(fields) <= set(self.fields)
+
+    def can_match(self, value):
+        """Слово достаточной длины для поиска по триграммам индекса"""
+        return len(normalize_search(value)) >= self.MIN_TERM_LENGTH
+
+    @staticmethod
+    def get_expression(values, fields=None):
+        """
+        Выражение MATCH: каждое нормализованное слово (или фраза в
+        кавычках) ищется как часть значения, слова объединяются через AND;
+        `fields` ограничивает поиск столбцами индекса.
+        """
+        terms = [
+            '"{}"'.format(normalize_search(value).replace('"', '""'))
+            for value in values
+        ]
+        expression = ' AND '.join(terms)
+        if fields:
+            expression = '{%s} : (%s)' % (' '.join(fields), expression)
+        return expression
+
+    def match(self, values, fields=None):
+        """
+        Условие отбора записей модели, найденных в индексе. Все слова
+        `values` должны проходить проверку `can_match`.
+        """
+        return self.model.id.in_(self.search(values, fields, ranked=False))
+
+    def search(self, values, fields=None, ranked=True):
+        """
+        Идентификаторы найденных записей, при `ranked` - в порядке
+        релевантности (bm25).
+        """
+        expression = self.get_expression(values, fields)
+        query = select(self.table.c.rowid).where(
+            literal_column(self.name).op('MATCH')(
+                bindparam('search_index_match', expression)
+            )
+        )
+        if ranked:
+            query = query.order_by(self.table.c.rank)
+        return query
+
+
+def get_search_index(model):
+    """Индекс модели, объявленный в `Meta.search_index` (поля поиска)"""
+    if NAMESUBD != 'sqlite':
+        return None
+    meta = getattr(model, 'Meta', None)
+    fields = getattr(meta, 'search_index', None)
+    if not fields:
+        return None
+    if fields is True:
+        fields = meta.fields_search
+    return SearchIndex(model, fields)
+
+
+def get_search_indexes():
+    from src.db.registry import get_model_meta
+
+    for mapper in Base.registry.mappers:
+        search_index = get_model_meta(mapper.class_).search_index
+        if search_index is not None:
+            yield search_index
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_search_indexes(target, connection, **kw):
+    for search_index in get_search_indexes():
+        search_index.create(connection)
+
+
+@event.listens_for(Base.metadata, 'before_drop')
+def drop_search_indexes(target, connection, **kw):
+    for search_index in get_search_indexes():
+        search_index.drop(connection)
+
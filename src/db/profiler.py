@@ -0,0 +1,148 @@
+import logging
+import re
+import time
+from collections import Counter, defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from src.config import settings
+from src.db.database import engine
+from src.db.diagnostics import record_slow_query
+
+logger = logging.getLogger(__name__)
+
+HEADER_NAME = 'X-DB-Queries'
+
+_re_string = re.compile(r"'(?:[^']|'')*'")
+_re_number = re.compile(r'\b\d+(?:\.\d+)?\b')
+_re_in_list = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_re_space = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(statement):
+    """
+    Нормализованный текст запроса: литералы заменены на '?', списки
+    параметров IN (?, ?, ...) свернуты, пробелы схлопнуты.
+    """
+    statement = _re_string.sub('?', statement)
+    statement = _re_number.sub('?', statement)
+    statement = _re_in_list.sub('(?)', statement)
+    return _re_space.sub(' ', statement).strip()
+
+
+class QueryStats:
+    """Запросы к БД, выполненные при обработке одного HTTP-запроса"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.durations = defaultdict(float)
+
+    def add(self, statement, duration):
+        key = fingerprint(statement)
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[key] += 1
+        self.durations[key] += duration
+
+    def suspects(self, threshold=None):
+        """Повторяющиеся запросы - вероятная проблема N+1"""
+        threshold = threshold or settings.QUERY_N_PLUS_ONE_THRESHOLD
+        return [
+            (key, count) for key, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+
+    def header(self):
+        return 'count={}; time={:.1f}ms; n+1={}'.format(
+            self.count, self.duration * 1000, len(self.suspects())
+        )
+
+
+def get_budget(endpoint):
+    return settings.QUERY_BUDGETS.get(endpoint, settings.QUERY_BUDGET_DEFAULT)
+
+
+# Время начала выполнения запросов соединения хранится по контексту
+# выполнения, а не стеком: запись запроса, завершившегося ошибкой, удаляется
+# в handle_error и не сдвигает время следующих запросов
+@event.listens_for(engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context,
+                      executemany):
+    conn.info.setdefault('query_start', {})[context] = time.perf_counter()
+
+
+@event.listens_for(engine, 'handle_error')
+def discard_query_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None:
+        connection.info.get('query_start', {}).pop(
+            exception_context.execution_context, None
+        )
+
+
+@event.listens_for(engine, 'after_cursor_execute')
+def collect_query_stats(conn, cursor, statement, parameters, context,
+                        executemany):
+    start = conn.info.get('query_start', {}).pop(context, None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    slow_query_ms = settings.SLOW_QUERY_MS
+    if (slow_query_ms is not None and not executemany
+            and duration * 1000 >= slow_query_ms):
+        record_slow_query(
+            cursor, statement, parameters, duration, fingerprint(statement)
+        )
+    if not has_request_context():
+        return
+    stats = g.get('db_query_stats')
+    if stats is not None:
+        stats.add(statement, duration)
+
+
+def start_request_stats():
+    g.db_query_stats = QueryStats()
+
+
+def report_request_stats(response):
+    stats = g.pop('db_query_stats', None)
+    if stats is None:
+        return response
+
+    endpoint = request.endpoint
+    suspects = stats.suspects()
+    for key, count in suspects:
+        logger.warning(
+            'N+1: %s - запрос выполнен %s раз: %s', endpoint, count, key
+        )
+    logger.debug('%s %s: %s', request.method, request.path, stats.header())
+    if (settings.QUERY_STATS_HEADER or current_app.debug
+            or current_app.testing):
+        response.headers[HEADER_NAME] = stats.header()
+
+    budget = get_budget(endpoint)
+    if budget is not None and stats.count > budget:
+        message = (
+            f'{endpoint}: выполнено {stats.count} запросов к БД, '
+            f'допустимо {budget}'
+        )
+        if settings.QUERY_BUDGET_STRICT or current_app.testing:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    return response
+
+
+def init_query_stats(app):
+    """Подсчет запросов к БД для всех представлений приложения"""
+    if not settings.QUERY_STATS:
+        return
+    app.before_request(start_request_stats)
+    app.after_request(report_request_stats)
@@ -0,0 +1,354 @@
+from types import FunctionType
+
+from sqlalchemy import Boolean, Date
+from sqlalchemy.orm import (
+    Relationship, aliased, joinedload, load_only, selectinload
+)
+
+from src.db.database import Base
+from src.db.fts import get_search_index
+
+LOOKUP_SEP = '__'
+
+
+def is_to_many(relation):
+    return relation.property.uselist
+
+
+def split_relations(relations):
+    """
+    Разделение отношений пути на начальные отношения "к одному", которые
+    присоединяются к запросу, и остальные, начиная с первого отношения
+    "ко многим", условие по которым проверяется подзапросом EXISTS.
+    """
+    for index, relation in enumerate(relations):
+        if is_to_many(relation):
+            return relations[:index], relations[index:]
+    return relations, []
+
+
+class FieldPath:
+    """
+    Разобранный путь поля модели вида 'employee__division__name'.
+
+    attrs - атрибуты модели для каждой части пути;
+    joins - отношения, через которые проходит путь (кроме последней части),
+    для соединения при фильтрации;
+    relations - все отношения пути, для внешнего соединения при поиске;
+    columns - столбцы пути, по которым выполняется поиск;
+    model, field_name, field - модель, имя и атрибут последней части пути.
+    """
+
+    def __init__(self, model, name):
+        self.name = name
+        self.attrs = []
+        self.joins = []
+        self.relations = []
+        self.columns = []
+
+        lookup_fields = name.split(LOOKUP_SEP)
+        for index, path_part in enumerate(lookup_fields):
+            field = getattr(model, path_part)
+            self.attrs.append(field)
+            if isinstance(field.property, Relationship):
+                self.relations.append(field)
+                if index < len(lookup_fields) - 1:
+                    model = field.property.entity.class_
+                    self.joins.append(field)
+            else:
+                self.columns.append(field)
+
+        self.model = model
+        self.field_name = lookup_fields[-1]
+        self.field = self.attrs[-1]
+        self.is_relationship = isinstance(self.field.property, Relationship)
+        self.label = self.get_label()
+        self.filter_type = self.get_filter_type()
+
+    def get_label(self):
+        label = self.field.info.get('label')
+        if label is None:
+            field = getattr(self.model, f'{self.field_name}_id', None)
+            if field is not None:
+                label = field.info.get('label')
+        return label
+
+    def get_filter_type(self):
+        if self.is_relationship:
+            return 'select'
+        elif isinstance(self.field.type, Boolean):
+            return 'boolean'
+        elif isinstance(self.field.type, Date):
+            return 'date'
+        return None
+
+
+class ProjectionNode:
+    """Узел дерева загружаемых полей: столбцы и вложенные отношения"""
+
+    def __init__(self, mapper):
+        self.mapper = mapper
+        self.columns = set()
+        self.relations = {}
+        self.full = False
+
+    def add_path(self, name):
+        node = self
+        lookup_fields = name.split(LOOKUP_SEP)
+        for index, path_part in enumerate(lookup_fields):
+            prop = node.mapper.attrs[path_part]
+            if isinstance(prop, Relationship):
+                child = node.relations.get(path_part)
+                if child is None:
+                    child = node.relations[path_part] = ProjectionNode(
+                        prop.mapper
+                    )
+                    # Внешние ключи отношения нужны для его загрузки
+                    node.columns.update(
+                        column.key for column in prop.local_columns
+                        if column.key in node.mapper.columns
+                    )
+                node = child
+                if index == len(lookup_fields) - 1:
+                    node.full = True
+            elif index == len(lookup_fields) - 1:
+                node.columns.add(path_part)
+            else:
+                raise KeyError(name)
+
+    def load_columns(self):
+        class_ = self.mapper.class_
+        keys = [column.key for column in self.mapper.primary_key]
+        keys += sorted(self.columns - set(keys))
+        return [getattr(class_, key) for key in keys]
+
+    def row_keys(self):
+        """
+        Столбцы узла при выборке строк. Отношение, указанное в полях целиком,
+        выбирается со всеми столбцами модели.
+        """
+        if not self.full:
+            return [column.key for column in self.load_columns()]
+        keys = [column.key for column in self.mapper.primary_key]
+        keys += [
+            attr.key for attr in self.mapper.column_attrs
+            if attr.key not in keys
+        ]
+        return keys
+
+    def generate_options(self, loader=None):
+        for key, child in self.relations.items():
+            attr = getattr(self.mapper.class_, key)
+            if loader is None:
+                child_loader = joinedload(attr)
+            else:
+                child_loader = loader.joinedload(attr)
+            if child.full:
+                yield child_loader
+            else:
+                yield child_loader.load_only(*child.load_columns())
+            yield from child.generate_options(child_loader)
+
+
+def get_row_methods(model):
+    """Методы модели (в т.ч. __str__), переносимые в класс строки"""
+    methods = {}
+    for klass in reversed(model.__mro__):
+        for name, value in vars(klass).items():
+            if name.startswith('__') and name != '__str__':
+                continue
+            if isinstance(
+                    value, (FunctionType, property, staticmethod, classmethod)
+            ):
+                methods[name] = value
+    return methods
+
+
+row_classes = {}
+
+
+def get_row_class(model, keys):
+    """
+    Легковесный класс строки модели: атрибуты `keys` в __slots__ и методы
+    модели, чтобы поля-методы списка вычислялись так же, как для
+    ORM-объекта.
+    """
+    row_class = row_classes.get((model, keys))
+    if row_class is not None:
+        return row_class
+
+    namespace = {
+        name: value
+        for name, value in get_model_meta(model).row_methods.items()
+        if name not in keys
+    }
+    namespace.update({
+        '__slots__': keys,
+        '__module__': model.__module__,
+        'Meta': getattr(model, 'Meta', None),
+    })
+    row_class = row_classes[(model, keys)] = type(
+        f'{model.__name__}Row', (), namespace
+    )
+
+    return row_class
+
+
+class RowLoader:
+    """
+    Выборка полей списка строками без создания ORM-объектов.
+
+    Столбцы модели и связанных моделей (через внешние соединения с
+    псевдонимами) выбираются одним запросом Core, `make_row` преобразует
+    строку результата в объект класса `get_row_class`.
+    """
+
+    def __init__(self, root):
+        self.columns = []
+        self.joins = []
+        self.make_row = self.construct(root, root.mapper.class_)
+
+    def construct(self, node, entity):
+        keys = node.row_keys()
+        start = len(self.columns)
+        self.columns.extend(getattr(entity, key) for key in keys)
+        columns = list(enumerate(keys, start))
+
+        relations = []
+        for key, child in node.relations.items():
+            alias = aliased(child.mapper.class_)
+            self.joins.append(getattr(entity, key).of_type(alias))
+            relations.append((key, self.construct(child, alias)))
+
+        row_class = get_row_class(
+            node.mapper.class_, tuple(keys) + tuple(node.relations)
+        )
+
+        def make_row(values):
+            # Нет связанной записи: первичный ключ из внешнего соединения NULL
+            if values[start] is None:
+                return None
+            row = row_class()
+            for index, key in columns:
+                setattr(row, key, values[index])
+            for key, make_related in relations:
+                setattr(row, key, make_related(values))
+            return row
+
+        return make_row
+
+
+class ModelMeta:
+    """Метаданные модели, вычисляемые один раз: пути полей и загрузка"""
+
+    def __init__(self, model):
+        self.model = model
+        self.paths = {}
+        self.projections = {}
+        self.row_loaders = {}
+        # Методы запоминаются при создании метаданных (в `build_registry`),
+        # до того как представления изменят атрибуты класса модели
+        self.row_methods = get_row_methods(model)
+        self.options_load = list(self.generate_options())
+        self._search_index = None
+
+    @property
+    def search_index(self):
+        """Полнотекстовый индекс модели (`Meta.search_index`) или None"""
+        if self._search_index is None:
+            self._search_index = get_search_index(self.model) or False
+        return self._search_index or None
+
+    def path(self, name):
+        field_path = self.paths.get(name)
+        if field_path is None:
+            field_path = self.paths[name] = FieldPath(self.model, name)
+        return field_path
+
+    def generate_options(self):
+        meta = getattr(self.model, 'Meta', None)
+        for attr_name, func_load in (
+                ('joined_related', joinedload),
+                ('select_in_related', selectinload),
+        ):
+            for field_name in getattr(meta, attr_name, None) or ():
+                result_load = None
+                for field in self.path(field_name).attrs:
+                    if result_load is None:
+                        result_load = func_load(field)
+                    else:
+                        attr = getattr(result_load, func_load.__name__)
+                        result_load = attr(field)
+                yield result_load
+
+    def get_projection(self, fields):
+        """
+        Параметры загрузки только тех столбцов и отношений, которые нужны
+        для отображения полей `fields` (см. `construct_projection`).
+        """
+        key = tuple(fields)
+        if key not in self.projections:
+            self.projections[key] = self.construct_projection(key)
+        return self.projections[key]
+
+    def construct_projection(self, fields):
+        root = self.construct_tree(fields)
+        if root is None:
+            return None
+
+        return [load_only(*root.load_columns()), *root.generate_options()]
+
+    def construct_tree(self, fields, keys=()):
+        """
+        Дерево загружаемых полей. Поле может быть столбцом или отношением
+        модели (в т.ч. путем через LOOKUP_SEP) либо методом, пути
+        зависимостей которого указаны в `Meta.fields_depends`. Если
+        зависимости поля неизвестны, возвращается None и загрузка
+        выполняется по `Meta` модели.
+        """
+        depends = getattr(self.model.Meta, 'fields_depends', {})
+        root = ProjectionNode(self.model.__mapper__)
+        for name in (*fields, *keys):
+            try:
+                for path in depends.get(name, (name,)):
+                    root.add_path(path)
+            except KeyError:
+                return None
+
+        return root
+
+    def get_row_loader(self, fields, keys=()):
+        """
+        Выборка полей `fields` строками (см. `RowLoader`); `keys` -
+        дополнительные столбцы модели, например поля сортировки.
+        """
+        key = (tuple(fields), tuple(keys))
+        if key not in self.row_loaders:
+            root = self.construct_tree(*key)
+            self.row_loaders[key] = root and RowLoader(root)
+        return self.row_loaders[key]
+
+    def prepare(self):
+        """Разбор всех путей полей, указанных в Meta модели"""
+        meta = getattr(self.model, 'Meta', None)
+        for attr_name in ('fields_filter', 'fields_search'):
+            for name in getattr(meta, attr_name, None) or ():
+                self.path(name)
+        fields_display = getattr(meta, 'fields_display', None)
+        if fields_display:
+            self.get_projection(fields_display)
+
+
+registry = {}
+
+
+def get_model_meta(model):
+    model_meta = registry.get(model)
+    if model_meta is None:
+        model_meta = registry[model] = ModelMeta(model)
+    return model_meta
+
+
+def build_registry():
+    for mapper in Base.registry.mappers:
+        get_model_meta(mapper.class_).prepare()
@@ -1,75 +1,165 @@
 from collections.abc import Iterable
-from flask import g
-from sqlalchemy import select, insert
-from sqlalchemy.orm import joinedload, selectinload
+from contextlib import contextmanager
+from flask import g, has_app_context
+from sqlalchemy import (
+    Enum, Integer, String, bindparam, cast, exists, func, insert, inspect,
+    literal, null, select, union_all, update
+)
+from sqlalchemy.schema import CreateColumn
 from typing import Union
 
-from src.db.database import Base, engine, session_factory
+from src.db.cache import (
+    choices_cache, count_cache, facet_cache, statement_cache
+)
+from src.db.database import Base, engine, get_session, normalize_search
+from src.db.registry import get_model_meta, get_row_class
+from src.db.writer import writer
 
 
 def get_options_load(model):
-    def generate_options():
-        def related_model(field_name, func_load):
-            try:
-                field = getattr(model, field_name)
-            except AttributeError:
-                lookup_fields = field_name.split("__")
-                lookup_model = model
-                for index, path_part in enumerate(lookup_fields):
-                    field = getattr(lookup_model, path_part)
-                    lookup_model = field.property.entity.class_
-                    if index == 0:
-                        result_load = func_load(field)
-                    else:
-                        attr = getattr(result_load, func_load.__name__)
-                        result_load = attr(field)
-            else:
-                result_load = func_load(field)
+    return get_model_meta(model).options_load
 
-            return result_load
 
-        try:
-            joined_related = model.Meta.joined_related
-        except AttributeError:
-            joined_related = None
-        try:
-            select_in_related = model.Meta.select_in_related
-        except AttributeError:
-            select_in_related = None
+class Repository:
 
-        if not joined_related and not select_in_related:
-            return
+    @classmethod
+    def recreate_table(cls):
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
 
-        if joined_related:
-            for field_name in joined_related:
-                yield related_model(field_name, joinedload)
-        if select_in_related:
-            for field_name in select_in_related:
-                yield related_model(field_name, selectinload)
+    @classmethod
+    def upgrade_table(cls):
+        """
+        Создание недостающих таблиц, столбцов и индексов в существующей БД
+        и пересчет теневых столбцов поиска.
+        """
+        cls.add_missing_columns()
+        Base.metadata.create_all(engine)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
+        cls.update_search_columns()
 
-    return list(generate_options())
+    @classmethod
+    def add_missing_columns(cls):
+        """
+        Добавление столбцов, объявленных в моделях, в существующие таблицы.
+        Выполняется до `create_all`, чтобы обработчики `after_create`
+        работали с полной схемой.
+        """
+        with engine.begin() as connection:
+            inspector = inspect(connection)
+            for table in Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {
+                    column['name']
+                    for column in inspector.get_columns(table.name)
+                }
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {table.name} ADD COLUMN '
+                        f'{CreateColumn(column).compile(connection)}'
+                    )
 
+    @classmethod
+    def update_search_columns(cls):
+        """Пересчет столбцов `<столбец>_search` (см. `normalize_search`)"""
+        with engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                shadows = [
+                    column for column in table.columns
+                    if 'search_source' in column.info
+                ]
+                if not shadows:
+                    continue
+                sources = [table.c[c.info['search_source']] for c in shadows]
+                rows = connection.execute(
+                    select(table.c.id, *sources, *shadows)
+                ).all()
+                count = len(shadows)
+                values = []
+                for row in rows:
+                    normalized = [
+                        normalize_search(value)
+                        for value in row[1:count + 1]
+                    ]
+                    if normalized != list(row[count + 1:]):
+                        values.append({
+                            'row_id': row[0],
+                            **{
+                                f'value_{i}': value
+                                for i, value in enumerate(normalized)
+                            },
+                        })
+                if values:
+                    connection.execute(
+                        update(table)
+                        .where(table.c.id == bindparam('row_id'))
+                        .values({
+                            shadow.name: bindparam(f'value_{i}')
+                            for i, shadow in enumerate(shadows)
+                        }),
+                        values,
+                    )
 
-class Repository:
+    @classmethod
+    @contextmanager
+    def unit_of_work(cls):
+        """
+        Объединение нескольких операций репозитория в одну транзакцию.
+
+        Внутри блока методы записи выполняют только flush, фиксация
+        изменений выполняется один раз при выходе из внешнего блока.
+        Транзакции записи выполняются последовательно (см. `writer`).
+        """
+        with get_session() as session, writer.lock():
+            writer.begin(session)
+            if not has_app_context():
+                yield session
+                session.commit()
+                return
+
+            depth = g.get('db_unit_of_work', 0)
+            g.db_unit_of_work = depth + 1
+            try:
+                yield session
+            except Exception:
+                session.rollback()
+                raise
+            else:
+                if depth == 0:
+                    session.commit()
+            finally:
+                g.db_unit_of_work = depth
 
     @classmethod
-    def recreate_table(cls):
-        Base.metadata.drop_all(engine)
-        Base.metadata.create_all(engine)
+    def commit(cls, session):
+        if has_app_context() and g.get('db_unit_of_work'):
+            session.flush()
+        else:
+            session.commit()
 
     @classmethod
     def bulk_insert(cls, model, values):
-        with session_factory() as session:
+        with cls.unit_of_work() as session:
             session.execute(insert(model), values)
-            session.commit()
+            cls.commit(session)
 
     @classmethod
     def task_count(cls, q):
+        signature = q.get_signature()
+        result = count_cache.get(signature)
+        if result is not None:
+            return result
+
         model = q.model
         outer_joins = q.outer_joins
         joins = q.joins
         filters = q.filters
-        with session_factory() as session:
+        with get_session() as session:
             query = session.query(model)
             if outer_joins and isinstance(outer_joins, Iterable):
                 for j in outer_joins:
@@ -81,19 +171,216 @@ class Repository:
                 query = query.filter(*filters)
             result = query.count()
 
+        count_cache.set(signature, result, q.get_tables())
+
+        return result
+
+    @classmethod
+    def task_get_facets(cls, facets):
+        """
+        Количество записей по значениям столбца для каждой пары
+        (`Query`, столбец) из `facets` одним запросом: группировки
+        объединяются через UNION ALL. Результат - список словарей
+        {значение: количество} в порядке `facets`.
+        """
+        key = tuple(
+            (q.get_signature(), str(column)) for q, column in facets
+        )
+        result = facet_cache.get(key)
+        if result is not None:
+            return result
+
+        selects = []
+        tables = set()
+        for index, (q, column) in enumerate(facets):
+            query = select(
+                literal(index).label('facet'),
+                column.label('value'),
+                func.count().label('count'),
+            ).select_from(q.model)
+            for j in q.outer_joins:
+                query = query.outerjoin(j)
+            for j in q.joins:
+                query = query.join(j)
+            if q.filters:
+                query = query.where(*q.filters)
+            selects.append(query.group_by(column))
+            tables.update(q.get_tables())
+
+        result = [{} for _ in facets]
+        if selects:
+            with get_session() as session:
+                for index, value, count in session.execute(
+                        union_all(*selects)
+                ):
+                    result[index][value] = count
+
+        facet_cache.set(key, result, tables)
+
+        return result
+
+    @classmethod
+    def task_get_choices(cls, queries):
+        """
+        Записи для списков выбора нескольких `Query` одним запросом:
+        выборки объединяются через UNION ALL с номером запроса и позицией
+        записи в нем. Записи - объекты класса строки модели
+        (`get_row_class`) со столбцами, нужными для `__str__`. Запросы,
+        которые нельзя объединить (соединения, `__str__` через отношения или
+        столбцы не строкового и не целого типа), выполняются отдельно.
+        Результат - списки записей в порядке `queries`.
+        """
+        result = [None] * len(queries)
+        batch = []
+        for index, q in enumerate(queries):
+            keys = cls.get_choice_keys(q)
+            if keys is None:
+                result[index] = cls.task_get_list(q)
+            else:
+                batch.append((index, q, keys))
+        if not batch:
+            return result
+
+        width = max(len(keys) for _, _, keys in batch) - 1
+        selects = []
+        for index, q, keys in batch:
+            model = q.model
+            values = [
+                cast(getattr(model, key), String).label(f'value_{number}')
+                for number, key in enumerate(keys[1:])
+            ]
+            values += [
+                null().label(f'value_{number}')
+                for number in range(len(values), width)
+            ]
+            position = func.row_number().over(order_by=q.ordering)
+            query = select(
+                literal(index).label('choice'),
+                position.label('position'),
+                getattr(model, keys[0]).label('id'),
+                *values,
+            ).select_from(model)
+            if q.filters:
+                query = query.where(*q.filters)
+            if q.ordering:
+                query = query.order_by(*q.ordering)
+            if q.limit:
+                query = query.limit(q.limit)
+            # LIMIT в части UNION ALL допустим только в подзапросе
+            subquery = query.subquery()
+            selects.append(select(*subquery.c))
+
+        rows = union_all(*selects).subquery()
+        for index, _, _ in batch:
+            result[index] = []
+        makers = {
+            index: cls.get_choice_maker(q, keys) for index, q, keys in batch
+        }
+        with get_session() as session:
+            for row in session.execute(
+                    select(*rows.c).order_by(rows.c.choice, rows.c.position)
+            ):
+                result[row.choice].append(makers[row.choice](row[2:]))
+
         return result
 
+    @classmethod
+    def get_choice_keys(cls, q):
+        """
+        Атрибуты модели для `__str__` при объединении в `task_get_choices`
+        (первый - первичный ключ) или None.
+        """
+        if q.joins or q.outer_joins:
+            return None
+        root = get_model_meta(q.model).construct_tree(('__str__',))
+        if root is None or root.relations:
+            return None
+        keys = root.row_keys()
+        columns = q.model.__mapper__.columns
+        if any(
+                not isinstance(columns[key].type, (String, Integer))
+                or isinstance(columns[key].type, Enum)
+                for key in keys
+        ):
+            return None
+        return keys
+
+    @classmethod
+    def get_choice_maker(cls, q, keys):
+        row_class = get_row_class(q.model, tuple(keys))
+        columns = q.model.__mapper__.columns
+        # Значения выбираются строками, целые приводятся обратно
+        converters = [
+            int if isinstance(columns[key].type, Integer) else str
+            for key in keys
+        ]
+
+        def make_row(values):
+            row = row_class()
+            for key, convert, value in zip(keys, converters, values):
+                setattr(row, key, None if value is None else convert(value))
+            return row
+
+        return make_row
+
     @classmethod
     def task_exists(cls, filters, model=None):
         model = model or g.model
-        with session_factory() as session:
+        with get_session() as session:
             subq = session.query(model).filter(*filters)
             result = session.query(subq.exists()).scalar()
 
         return result
 
     @classmethod
-    def task_get_list(cls, q, first=None):
+    def task_exists_many(cls, filters_list):
+        """
+        Проверка существования записей для нескольких наборов условий одним
+        запросом: SELECT EXISTS(...), EXISTS(...), ...
+        """
+        query = select(*(
+            exists().where(*filters).label(f'exists_{index}')
+            for index, filters in enumerate(filters_list)
+        ))
+        with get_session() as session:
+            result = session.execute(query).one()
+
+        return [bool(value) for value in result]
+
+    @classmethod
+    def get_statement(cls, key, factory):
+        """
+        Базовый запрос из кэша `statement_cache` по ключу формы запроса.
+        При промахе запрос строится функцией `factory`.
+        """
+        statement = statement_cache.get(key)
+        if statement is None:
+            statement = factory()
+            statement_cache.set(key, statement, ())
+
+        return statement
+
+    @classmethod
+    def get_row_loader(cls, q):
+        """
+        Выборка строк без создания ORM-объектов для запроса с `rows`.
+        None, если запрос загружает объекты модели.
+        """
+        if not (q.rows and q.projection):
+            return None
+        return get_model_meta(q.model).get_row_loader(
+            q.projection, [field.key for field, _ in q.ordering_fields]
+        )
+
+    @classmethod
+    def get_select(cls, q, with_total=False):
+        """
+        Запрос списка по `Query`. Соединения, сортировка и параметры загрузки
+        связанных моделей зависят только от формы запроса, поэтому базовый
+        запрос кэшируется; фильтры и страница добавляются к нему при каждом
+        вызове. Повторная компиляция SQL для запросов одной формы исключается
+        кэшем скомпилированных запросов SQLAlchemy.
+        """
         model = q.model
         filters = q.filters
         outer_joins = q.outer_joins
@@ -102,8 +389,17 @@ class Repository:
         limit = q.limit
         offset = q.offset
 
-        with session_factory() as session:
-            query = select(model).select_from(model)
+        def construct_select():
+            columns = []
+            if with_total:
+                columns.append(func.count().over().label('total'))
+            row_loader = cls.get_row_loader(q)
+            if row_loader is None:
+                query = select(model, *columns).select_from(model)
+            else:
+                query = select(
+                    *row_loader.columns, *columns
+                ).select_from(model)
 
             if outer_joins and isinstance(outer_joins, Iterable):
                 for j in outer_joins:
@@ -111,23 +407,100 @@ class Repository:
             if joins and isinstance(joins, Iterable):
                 for j in joins:
                     query = query.join(j)
-            if filters and isinstance(filters, Iterable):
-                query = query.filter(*filters)
             if ordering:
                 query = query.order_by(*ordering)
-            options_load = get_options_load(model)
-            query = query.options(*options_load)
-            if limit:
-                query = query.offset(offset).limit(limit)
+            if row_loader is not None:
+                for j in row_loader.joins:
+                    query = query.outerjoin(j)
+                return query
+            options_load = None
+            if q.projection:
+                options_load = get_model_meta(model).get_projection(
+                    q.projection
+                )
+            if options_load is None:
+                options_load = get_options_load(model)
+            return query.options(*options_load)
+
+        query = cls.get_statement(
+            ('list', q.get_shape(), with_total), construct_select
+        )
+        if filters and isinstance(filters, Iterable):
+            query = query.filter(*filters)
+        if limit:
+            query = query.offset(offset).limit(limit)
+
+        return query
 
-            result_query = session.execute(query)
-            if first:
+    @classmethod
+    def cache_stats(cls):
+        return {
+            'choices': choices_cache.stats(),
+            'count': count_cache.stats(),
+            'facet': facet_cache.stats(),
+            'statement': statement_cache.stats(),
+        }
+
+    @classmethod
+    def write_stats(cls):
+        return writer.stats()
+
+    @classmethod
+    def task_get_list(cls, q, first=None):
+        row_loader = cls.get_row_loader(q)
+        with get_session() as session:
+            result_query = session.execute(cls.get_select(q))
+            if row_loader is not None:
+                rows = result_query.all()
+                result = [row_loader.make_row(row) for row in rows]
+                if first:
+                    result = result[0] if result else None
+            elif first:
                 result = result_query.scalars().first()
             else:
                 result = result_query.unique().scalars().all()
 
         return result
 
+    @classmethod
+    def task_get_page(cls, q):
+        """
+        Записи страницы и общее количество записей за один запрос.
+
+        Общее количество берется из кэша `count_cache`, при его отсутствии
+        вычисляется оконной функцией COUNT(*) OVER (). Если страница пуста
+        (номер страницы больше последней), количество запрашивается отдельно
+        через `task_count`.
+        """
+        signature = q.get_signature()
+        total = count_cache.get(signature)
+        if total is not None:
+            return cls.task_get_list(q), total
+
+        row_loader = cls.get_row_loader(q)
+        with get_session() as session:
+            query = cls.get_select(q, with_total=True)
+            result_query = session.execute(query)
+            # Условия по отношениям "ко многим" проверяются через EXISTS, и
+            # строки не размножаются; unique() нужен только для объектов
+            # моделей с загрузкой коллекций через joinedload
+            if row_loader is None:
+                result_query = result_query.unique()
+            rows = result_query.all()
+
+        if rows:
+            total = rows[0].total
+        elif not q.offset:
+            total = 0
+        else:
+            return [], cls.task_count(q)
+
+        count_cache.set(signature, total, q.get_tables())
+
+        if row_loader is not None:
+            return [row_loader.make_row(row) for row in rows], total
+        return [row[0] for row in rows], total
+
     @classmethod
     def task_get_object(cls, filters: Union[dict, str, int], model=None):
         model = model or g.model
@@ -140,11 +513,11 @@ class Repository:
                 f'{filters} должен быть int, "int", dict'
             )
 
-        with session_factory() as session:
-            query = select(model).filter_by(**filters)
-
-            options_load = get_options_load(model)
-            query = query.options(*options_load)
+        with get_session() as session:
+            query = cls.get_statement(
+                ('object', model),
+                lambda: select(model).options(*get_options_load(model))
+            ).filter_by(**filters)
 
             result = session.execute(query).unique().scalar_one()
 
@@ -152,41 +525,41 @@ class Repository:
 
     @classmethod
     def task_update_object(cls, obj):
-        with session_factory() as session:
+        with cls.unit_of_work() as session:
             session.add(obj)
-            session.commit()
+            cls.commit(session)
             session.refresh(obj)
 
     @classmethod
     def task_add_object(cls, obj):
-        with session_factory() as session:
+        with cls.unit_of_work() as session:
             session.add(obj)
-            session.commit()
+            cls.commit(session)
             session.refresh(obj)
             g.object = obj
 
     @classmethod
     def task_add_si(cls, obj):
-        with session_factory() as session:
+        with cls.unit_of_work() as session:
             session.add(obj)
             session.flush()
             g.object_service.si_id = obj.id
             session.add(g.object_service)
-            session.commit()
+            cls.commit(session)
             session.refresh(obj)
             g.object = obj
 
     @classmethod
     def task_out_service(cls, obj):
         objs = [obj, g.object_si]
-        with session_factory() as session:
+        with cls.unit_of_work() as session:
             session.add_all(objs)
-            session.commit()
+            cls.commit(session)
             session.refresh(obj)
 
     @classmethod
     def task_update_service(cls, obj, status):
-        with session_factory() as session:
+        with cls.unit_of_work() as session:
             obj = session.merge(obj)
             g.object_si = session.merge(g.object_si)
             object_status = (
@@ -196,21 +569,21 @@ class Repository:
                 .one()
             )
             g.object_si.status_service = object_status.name
-            session.commit()
+            cls.commit(session)
             session.refresh(g.object_si)
 
     @classmethod
     def task_add_service(cls, obj):
-        with session_factory() as session:
+        with cls.unit_of_work() as session:
             objs = [obj, g.object_si]
             session.add_all(objs)
             session.flush()
             g.object_si.status_service = obj.status_service.name
-            session.commit()
+            cls.commit(session)
             session.refresh(g.object_si)
 
     @classmethod
     def task_delete_object(cls, obj):
-        with session_factory() as session:
+        with cls.unit_of_work() as session:
             session.delete(obj)
-            session.commit()
+            cls.commit(session)
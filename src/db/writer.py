@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy.exc import OperationalError
+
+from src.config import settings, NAMESUBD
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+WRITE_TRANSACTION = 'write_transaction'
+
+
+def is_busy_error(error):
+    message = str(getattr(error, 'orig', error)).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+class Writer:
+    """
+    Последовательная запись в БД внутри процесса.
+
+    Блокировка процесса (и, если указан SQLITE_WRITE_LOCK_FILE, файловая
+    блокировка между процессами) удерживается на время транзакции записи.
+    Транзакция SQLite начинается сразу с блокировкой записи
+    (BEGIN IMMEDIATE), а при SQLITE_BUSY попытка повторяется с нарастающей
+    задержкой, поэтому при конкуренции запись ожидает, а не завершается
+    ошибкой "database is locked".
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.writes = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @contextmanager
+    def lock(self):
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+
+        start = time.perf_counter()
+        with self._lock:
+            lock_file = self.acquire_file_lock()
+            wait_time = time.perf_counter() - start
+            with self._stats_lock:
+                self.writes += 1
+                self.wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+            self._local.depth = 1
+            try:
+                yield
+            finally:
+                self._local.depth = 0
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    @staticmethod
+    def acquire_file_lock():
+        path = settings.SQLITE_WRITE_LOCK_FILE
+        if not path or fcntl is None:
+            return None
+        lock_file = open(path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def begin(self, session):
+        """
+        Начало транзакции записи с повтором при занятой БД. Сессия
+        отмечается в `info` (WRITE_TRANSACTION) до фиксации или отката:
+        только в ней учитываются изменения таблиц (`src.db.cache`).
+        """
+        session.info[WRITE_TRANSACTION] = True
+        if NAMESUBD != 'sqlite':
+            return
+        connection = session.connection()
+        if connection.connection.dbapi_connection.in_transaction:
+            return
+
+        retries = settings.SQLITE_WRITE_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+                return
+            except OperationalError as e:
+                if not is_busy_error(e) or attempt == retries:
+                    with self._stats_lock:
+                        self.failures += 1
+                    raise
+            with self._stats_lock:
+                self.retries += 1
+            time.sleep(self.get_delay(attempt))
+
+    @staticmethod
+    def get_delay(attempt):
+        delay = settings.SQLITE_WRITE_BACKOFF * 2 ** attempt
+        delay = min(delay, settings.SQLITE_WRITE_BACKOFF_MAX)
+        return delay * random.uniform(0.5, 1)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'writes': self.writes,
+                'retries': self.retries,
+                'failures': self.failures,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time,
+            }
+
+
+writer = Writer()
@@ -37,8 +37,8 @@ class UserListSiView(UserSiView, ListSiView):
         'employee',
         'employee' + LOOKUP_SEP + 'division',
         'is_service',
-        'service' + LOOKUP_SEP + 'date_last_service',
-        'service' + LOOKUP_SEP + 'date_next_service',
+        'current_service' + LOOKUP_SEP + 'date_last_service',
+        'current_service' + LOOKUP_SEP + 'date_next_service',
     ]
     fields_search = [
         'name_si' + LOOKUP_SEP + 'name',
@@ -6,6 +6,9 @@ from flask_login import LoginManager
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 from src.auth.UserLogin import UserLogin
 from src.config import settings
+from src.db.database import close_session
+from src.db.profiler import init_query_stats
+from src.db.registry import build_registry
 
 
 from src.admin.router import router as router_admin
@@ -26,6 +29,11 @@ def create_app():
     app.register_blueprint(router_device)
     app.register_blueprint(router_source)
 
+    app.teardown_appcontext(close_session)
+    init_query_stats(app)
+
+    build_registry()
+
     return app
 
 
@@ -55,5 +63,10 @@ if __name__ == "__main__":
 
         Repository.recreate_table()
 
+    elif '--db_upgrade' in sys.argv:
+        from src.db.repository import Repository
+
+        Repository.upgrade_table()
+
     else:
         app.run()
@@ -1,8 +1,12 @@
 import datetime
 from typing import Optional, List
 
-from sqlalchemy import ForeignKey
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import (
+    Delete, ForeignKey, Insert, Update, event, func, inspect, select, update
+)
+from sqlalchemy.orm import (
+    Mapped, Session, foreign, mapped_column, relationship
+)
 
 from src.core import LOOKUP_SEP, value_for_field
 from src.db.database import Base, BasePK, str_1000
@@ -31,7 +35,7 @@ class Si(BasePK, Base):
         info={'label': 'Тип СИ'}
     )
     number: Mapped[Optional[str]] = mapped_column(
-        info={'label': 'Заводской номер'}
+        info={'label': 'Заводской номер', 'search': True}
     )
     description_method_id: Mapped[Optional[int]] = mapped_column(
         ForeignKey("description_method.id", ondelete="CASCADE"),
@@ -56,7 +60,7 @@ class Si(BasePK, Base):
         }
     )
     nomenclature: Mapped[Optional[str]] = mapped_column(
-        info={'label': 'Номенклатурный номер'}
+        info={'label': 'Номенклатурный номер', 'search': True}
     )
     room_use_etalon_id: Mapped[Optional[int]] = mapped_column(
         ForeignKey("room.id", ondelete="CASCADE"),
@@ -82,6 +86,10 @@ class Si(BasePK, Base):
         info={'label': 'На обслуживании'},
         default=False
     )
+    # Текущее обслуживание, поддерживается `update_current_service`
+    current_service_id: Mapped[Optional[int]] = mapped_column(
+        info={'label': 'Текущее обслуживание'}
+    )
 
     group_si: Mapped["GroupSi"] = relationship(back_populates="si")
     name_si: Mapped["NameSi"] = relationship(back_populates="si")
@@ -105,12 +113,16 @@ class Si(BasePK, Base):
     service: Mapped[List["Service"]] = relationship(
         back_populates="si",
         cascade='save-update, merge, delete',
+        order_by="Service.id",
     )
 
     class Meta(Base.Meta):
         action_suffix = 'о'
         verbose_name = 'Средство измерения'
         verbose_name_plural = 'Средства измерения'
+        indexes = (
+            ('current_service_id',),
+        )
 
         joined_related = (
             'group_si',
@@ -124,7 +136,7 @@ class Si(BasePK, Base):
             'room_delivery',
             'employee',
             'employee' + LOOKUP_SEP + 'division',
-            'service',
+            'current_service',
         )
         fields_display = (
             'group_si',
@@ -151,6 +163,19 @@ class Si(BasePK, Base):
             'certificate',
             'status_service',
         )
+        fields_depends = {
+            'description': ('description_method',),
+            'method': ('description_method',),
+            'division': ('employee' + LOOKUP_SEP + 'division',),
+            'email': ('employee',),
+            'date_last_service': (
+                'current_service' + LOOKUP_SEP + 'date_last_service',
+            ),
+            'date_next_service': (
+                'current_service' + LOOKUP_SEP + 'date_next_service',
+            ),
+            'certificate': ('current_service' + LOOKUP_SEP + 'certificate',),
+        }
         fields_filter = (
             'group_si',
             'name_si',
@@ -165,8 +190,8 @@ class Si(BasePK, Base):
             'room_delivery',
             'employee',
             'employee' + LOOKUP_SEP + 'division',
-            'service' + LOOKUP_SEP + 'date_last_service',
-            'service' + LOOKUP_SEP + 'date_next_service',
+            'current_service' + LOOKUP_SEP + 'date_last_service',
+            'current_service' + LOOKUP_SEP + 'date_next_service',
         )
         fields_search = (
             'group_si' + LOOKUP_SEP + 'name',
@@ -187,19 +212,14 @@ class Si(BasePK, Base):
             # 'employee' + LOOKUP_SEP + 'middle_name',
             # 'employee' + LOOKUP_SEP + 'division' + LOOKUP_SEP + 'name',
         )
+        # Поиск по полям fields_search через индекс FTS5 (src/db/fts.py)
+        search_index = True
 
     def __str__(self):
         return self.number
 
     def data_service(self, field_name):
-        try:
-            data = getattr(
-                self.service[-2 if self.is_service else -1], field_name
-            )
-        except IndexError:
-            data = None
-
-        return data
+        return getattr(self.current_service, field_name, None)
 
     def division(self):
         return self.employee.division
@@ -287,6 +307,12 @@ class Service(BasePK, Base):
         verbose_name = 'Обслуживание СИ'
         verbose_name_plural = 'Обслуживание СИ'
         ordering = ('date_in_service',)
+        indexes = (
+            ('si_id', 'is_out'),
+            ('si_id', 'date_in_service'),
+            ('date_last_service',),
+            ('date_next_service',),
+        )
         joined_related = ('si', 'status_service')
         fields_display = (
             'si', 'date_in_service', 'date_last_service', 'status_service',
@@ -297,3 +323,105 @@ class Service(BasePK, Base):
 
     def __str__(self):
         return str(self.si)
+
+
+# Текущее (последнее завершенное) обслуживание СИ. Открытое обслуживание
+# имеет is_out=False, поэтому запись совпадает с service[-2] для СИ на
+# обслуживании и с service[-1] для остальных. Ссылка хранится в
+# Si.current_service_id, чтобы фильтры и столбцы дат обслуживания списка
+# выполнялись соединением по индексу, а не подзапросом по всей истории.
+Si.current_service = relationship(
+    Service,
+    primaryjoin=foreign(Si.current_service_id) == Service.id,
+    viewonly=True,
+    uselist=False,
+)
+
+
+def update_current_service(connection, si_ids=None):
+    """Пересчет Si.current_service_id для СИ `si_ids` (None - для всех)"""
+    si, service = Si.__table__, Service.__table__
+    query = update(si).values(
+        current_service_id=(
+            select(func.max(service.c.id))
+            .where(service.c.si_id == si.c.id, service.c.is_out)
+            .scalar_subquery()
+        )
+    )
+    if si_ids is not None:
+        query = query.where(si.c.id.in_(si_ids))
+    connection.execute(query)
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_service_changes(session, flush_context):
+    si_ids = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, Service):
+            continue
+        history = inspect(obj).attrs.si_id.history
+        si_ids.update(
+            si_id for si_id in (obj.si_id, *history.deleted)
+            if si_id is not None
+        )
+    if si_ids:
+        session.info.setdefault('current_service_si', set()).update(si_ids)
+
+
+def expire_current_service(session, si_ids=None):
+    """Сброс загруженной ссылки у объектов СИ сессии (None - у всех)"""
+    if si_ids is None:
+        objs = [
+            obj for obj in session.identity_map.values()
+            if isinstance(obj, Si)
+        ]
+    else:
+        objs = [
+            session.identity_map.get(session.identity_key(Si, si_id))
+            for si_id in si_ids
+        ]
+    for obj in objs:
+        if obj is not None:
+            session.expire(obj, ['current_service_id', 'current_service'])
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def refresh_current_service(session, flush_context):
+    si_ids = session.info.pop('current_service_si', None)
+    if not si_ids:
+        return
+    update_current_service(session.connection(), si_ids)
+    expire_current_service(session, si_ids)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def refresh_executed_current_service(orm_execute_state):
+    # Запись в обслуживание без ORM-объектов (`Repository.bulk_insert`,
+    # session.execute(update(Service)...)): ссылка пересчитывается после
+    # выполнения запроса, для вставки - только для СИ вставленных записей
+    statement = orm_execute_state.statement
+    if not (
+            isinstance(statement, (Insert, Update, Delete))
+            and statement.table.name == Service.__table__.name
+    ):
+        return None
+    result = orm_execute_state.invoke_statement()
+
+    si_ids = None
+    parameters = orm_execute_state.parameters
+    if isinstance(statement, Insert) and parameters:
+        if isinstance(parameters, dict):
+            parameters = [parameters]
+        if all(params.get('si_id') is not None for params in parameters):
+            si_ids = {params['si_id'] for params in parameters}
+    session = orm_execute_state.session
+    update_current_service(session.connection(), si_ids)
+    expire_current_service(session, si_ids)
+
+    return result
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def create_current_service(target, connection, **kw):
+    # Заполнение ссылки для существующих записей (--db_upgrade)
+    update_current_service(connection)
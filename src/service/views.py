@@ -77,6 +77,8 @@ class ServiceAddOutMixin(ServiceMixin, FormMixin):
 
 class ListSiView(SiMixin, ListMixin):
     sidebar = 'filter_sidebar'
+    row_results = True
+    facet_counts = True
 
     def get_add_url(self):
         return try_get_url('.add_si')
@@ -144,9 +146,8 @@ class ChangeSiView(SiMixin, ChangeMixin):
 
     def pre_save(self, obj):
         obj = super().pre_save(obj)
-        index = -2 if obj.is_service else -1
         for field in self.extra_fields:
-            setattr(obj.service[index], field, getattr(obj, field))
+            setattr(obj.current_service, field, getattr(obj, field))
 
         return obj
 
@@ -234,8 +235,8 @@ class ListServiceView(ListMixin):
     def get_url_for_result(self, result):
         return try_get_url(f'.change_{self.blueprint_name}', pk=result.id)
 
-    def get_query(self, query=None):
-        query = super().get_query(query)
+    def get_query(self, query=None, params=None):
+        query = super().get_query(query, params)
         query += Query(filters=[~g.model.is_out])
         return query
 
@@ -346,6 +347,8 @@ class HistoryServiceView(ListMixin):
     model_name = 'service'
     fields_link = None
     fields_search = None
+    keyset_pagination = True
+    row_results = True
 
     def get_fields_display(self):
         return (
@@ -362,7 +365,7 @@ class HistoryServiceView(ListMixin):
     def get_btn(self):
         return {}
 
-    def get_query(self, query=None):
-        query = super().get_query(query)
+    def get_query(self, query=None, params=None):
+        query = super().get_query(query, params)
         query += Query(filters=[g.model.si_id == self.pk, g.model.is_out])
         return query
@@ -1,13 +1,15 @@
 from flask import Blueprint, current_app, send_file
 from werkzeug.security import safe_join
 
-from src.source.views import ValueChangeView
+from src.source.views import AutocompleteView, ValueChangeView
 
 router = Blueprint('source', __name__, url_prefix='/')
 
 
 router.add_url_rule('/valuechange/',
                     view_func=ValueChangeView.as_view(name="valuechange"))
+router.add_url_rule('/autocomplete/<model_name>/',
+                    view_func=AutocompleteView.as_view(name="autocomplete"))
 
 
 @router.route('/view/<path:filename>')
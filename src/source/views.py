@@ -1,8 +1,10 @@
-from flask import jsonify, request
+from flask import abort, jsonify, request
 from flask.views import View
 from sqlalchemy.exc import NoResultFound
 
-from src.core.constants import EMPTY_VALUE_DISPLAY
+from src.config import settings
+from src.core.constants import EMPTY_VALUE_DISPLAY, PAGE_VAR, SEARCH_VAR
+from src.core.queries import Query
 from src.db.repository import Repository
 from src.core.utils import display_for_field, get_model
 
@@ -60,3 +62,50 @@ class ValueChangeView(View):
                 self.data.update(method=value)
         except (AttributeError, ValueError, NoResultFound):
             pass
+
+
+class AutocompleteView(View):
+    """
+    Варианты справочника для списка с автодополнением: поиск вхождения
+    слов в поля `Meta.fields_search` модели (`Query.query_search`),
+    постранично.
+
+    Параметры запроса: q - строка поиска, p - номер страницы (с 1),
+    limit - количество вариантов на странице (не более
+    AUTOCOMPLETE_MAX_LIMIT). Ответ: {"results": [{"id", "text"}], "more"}.
+    """
+
+    def dispatch_request(self, model_name):
+        model = get_model(model_name)
+        if getattr(model, 'view', None) is None:
+            abort(404)
+
+        limit = self.get_int('limit', settings.AUTOCOMPLETE_LIMIT)
+        limit = min(limit, settings.AUTOCOMPLETE_MAX_LIMIT)
+        page = self.get_int(PAGE_VAR, 1)
+        query = Query(
+            model=model,
+            params={SEARCH_VAR: request.args.get(SEARCH_VAR, '')},
+            fields_search=getattr(model.Meta, 'fields_search', None),
+            filters=[model.view],
+            # Лишняя запись показывает, есть ли следующая страница
+            limit=limit + 1,
+            offset=(page - 1) * limit,
+        )
+        result = Repository.task_get_list(q=query)
+
+        return jsonify({
+            'results': [
+                {'id': str(obj.id), 'text': str(obj)}
+                for obj in result[:limit]
+            ],
+            'more': len(result) > limit,
+        })
+
+    @staticmethod
+    def get_int(name, default):
+        try:
+            value = int(request.args.get(name, default))
+        except ValueError:
+            return default
+        return value if value > 0 else default
@@ -0,0 +1,96 @@
+'use strict';
+{
+    window.addEventListener('load', function() {
+
+        // Задержка перед запросом при вводе строки поиска, мс
+        const DELAY = 300;
+
+        // Список с автодополнением: на странице выведено только выбранное
+        // значение, остальные варианты загружаются с сервера (data-autocomplete)
+        function Autocomplete(select) {
+            const url = select.dataset.autocomplete;
+            // Варианты, не относящиеся к записям справочника ("---------", "Не важно")
+            const fixed = Array.from(select.options).filter(option => !/^\d+$/.test(option.value));
+            const input = document.createElement('input');
+            const more = document.createElement('button');
+            let page = 1;
+            let loaded = false;
+            let timer = null;
+
+            input.type = 'search';
+            input.className = 'autocomplete-search';
+            input.placeholder = 'Поиск...';
+            more.type = 'button';
+            more.className = 'autocomplete-more';
+            more.textContent = 'Показать еще...';
+            more.hidden = true;
+            select.before(input);
+            select.after(more);
+
+            //Запрос страницы вариантов
+            function load(reset) {
+                page = reset ? 1 : page + 1;
+                let params = new URLSearchParams({
+                    'q': input.value,
+                    'p': page
+                });
+                fetch(`${url}?${params}`, {
+                    method: 'GET',
+                    headers: {
+                        'Content-Type': 'application/x-www-urlencoded',
+                    },
+                })
+                    .then(response => response.json())
+                    .then(json => render(json, reset))
+                    .catch(error => console.error(error))
+            };
+
+            //Вывод вариантов с сохранением выбранного значения
+            function render(data, reset) {
+                const value = select.value;
+                if (reset) {
+                    const selected = select.selectedOptions[0];
+                    select.replaceChildren(...fixed);
+                    if (selected && !fixed.includes(selected)) {
+                        select.append(selected);
+                    }
+                }
+                data.results.forEach(item => {
+                    if (item.id !== value) {
+                        select.append(new Option(item.text, item.id));
+                    }
+                });
+                select.value = value;
+                more.hidden = !data.more;
+                loaded = true;
+            };
+
+            // Первая страница загружается при открытии списка
+            select.addEventListener('mousedown', () => {
+                if (!loaded) {
+                    load(true);
+                }
+            });
+            select.addEventListener('focus', () => {
+                if (!loaded) {
+                    load(true);
+                }
+            });
+            input.addEventListener('input', () => {
+                clearTimeout(timer);
+                timer = setTimeout(() => load(true), DELAY);
+            });
+            // Enter в строке поиска не отправляет форму
+            input.addEventListener('keydown', (event) => {
+                if (event.key === 'Enter') {
+                    event.preventDefault();
+                    clearTimeout(timer);
+                    load(true);
+                }
+            });
+            more.addEventListener('click', () => load(false));
+        };
+
+        document.querySelectorAll('select[data-autocomplete]').forEach(select => Autocomplete(select));
+    })
+}
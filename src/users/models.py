@@ -12,13 +12,13 @@ class UserProfile(BasePK, Base):
     username: Mapped[str_100] = mapped_column(info={'label': 'Логин'})
     password: Mapped[str] = mapped_column(info={'label': 'Пароль'})
     last_name: Mapped[str_100] = mapped_column(
-        info={'label': 'Фамилия'}
+        info={'label': 'Фамилия', 'search': True}
     )
     first_name: Mapped[Optional[str_100]] = mapped_column(
-        info={'label': 'Имя'}
+        info={'label': 'Имя', 'search': True}
     )
     middle_name: Mapped[Optional[str_100]] = mapped_column(
-        info={'label': 'Отчество'}
+        info={'label': 'Отчество', 'search': True}
     )
     email: Mapped[Optional[str]] = mapped_column(
         info={'label': 'e-mail'}, unique=True)
@@ -36,6 +36,9 @@ class UserProfile(BasePK, Base):
         fields_display = (
             'username', 'get_full_name', 'email', 'is_active', 'date_joined',
         )
+        fields_depends = {
+            'get_full_name': ('last_name', 'first_name', 'middle_name'),
+        }
         fields_search = ('username', 'last_name', 'first_name', 'middle_name')
 
     def __repr__(self):
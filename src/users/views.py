@@ -11,8 +11,8 @@ class IndexView(IndexMixin):
 
 
 class ListObjectView(SettingsMixin, ListMixin):
-    def get_query(self, query=None):
-        query = super().get_query(query)
+    def get_query(self, query=None, params=None):
+        query = super().get_query(query, params)
         if not g.user.is_superuser:
             query += Query(filters=[~g.model.is_superuser])
 